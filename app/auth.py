@@ -1,8 +1,18 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
+from app.crud import get_user_by_username
+from app.limits import ConcurrencyLimiter
 from config.config import Config
 
 ALGORITHM = "HS256"
@@ -19,6 +29,142 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: str = None
 
+class TokenCache:
+    """LRU cache of verified token claims, each entry valid until the token's exp."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, token: str):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        token_data, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return token_data
+
+    def set(self, token: str, token_data: "TokenData", expires_at: float):
+        if self.maxsize <= 0:
+            return
+        self._entries[token] = (token_data, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+token_cache = TokenCache(Config.TOKEN_CACHE_SIZE)
+# Failed (username, password) pairs, each with the stored hash it was checked
+# against ("" for an unknown user), so a replayed credential list is rejected
+# without another hash until the entry expires.
+failed_login_cache = TokenCache(Config.LOGIN_FAILURE_CACHE_SIZE)
+
+def _b64(data: bytes):
+    return base64.b64encode(data).decode()
+
+class PasswordHasher:
+    """scrypt hashing on a bounded thread pool.
+
+    hashlib releases the GIL while it hashes, so verifications run in
+    parallel across cores and the event loop keeps serving other requests.
+    At most `workers` hashes run at once; callers beyond that wait briefly
+    in the limiter and are then turned away with 503.
+    """
+
+    def __init__(
+        self,
+        workers: int = Config.PASSWORD_HASH_WORKERS,
+        max_waiting: int = Config.PASSWORD_HASH_MAX_WAITING,
+        queue_timeout: float = Config.PASSWORD_HASH_QUEUE_TIMEOUT,
+        n: int = Config.PASSWORD_SCRYPT_N,
+        r: int = 8,
+        p: int = 1,
+    ):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.limiter = ConcurrencyLimiter(workers, max_waiting, queue_timeout, reason="login_busy")
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="password-hash")
+        self._dummy_hash = None
+
+    @staticmethod
+    def _scrypt(password: str, salt: bytes, n: int, r: int, p: int):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r)
+
+    def hash_sync(self, password: str):
+        salt = os.urandom(16)
+        digest = self._scrypt(password, salt, self.n, self.r, self.p)
+        return f"scrypt${self.n}${self.r}${self.p}${_b64(salt)}${_b64(digest)}"
+
+    @classmethod
+    def verify_sync(cls, password: str, hashed_password: str):
+        # Parameters come from the stored hash, so raising PASSWORD_SCRYPT_N
+        # only applies to new hashes and old ones keep verifying.
+        try:
+            scheme, n, r, p, salt, digest = hashed_password.split("$")
+        except ValueError:
+            return False
+        if scheme != "scrypt":
+            return False
+        candidate = cls._scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(candidate, base64.b64decode(digest))
+
+    async def _run(self, function, *args):
+        async with self.limiter.slot():
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def hash(self, password: str):
+        return await self._run(self.hash_sync, password)
+
+    async def verify(self, password: str, hashed_password: str = None):
+        """Checks password against hashed_password, or against a throwaway hash when there is no user so both cases take as long."""
+        if hashed_password is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = await self.hash(os.urandom(16).hex())
+            hashed_password = self._dummy_hash
+        return await self._run(self.verify_sync, password, hashed_password)
+
+password_hasher = PasswordHasher()
+
+_login_key_secret = os.urandom(32)
+
+def _login_key(username: str, password: str):
+    # Keyed so the cache never holds anything a leaked password could be checked against offline.
+    return hmac.new(_login_key_secret, f"{username}\0{password}".encode(), hashlib.sha256).hexdigest()
+
+async def authenticate_user(session, username: str, password: str):
+    """Returns the user row for valid credentials, or None."""
+    key = _login_key(username, password)
+    user = await get_user_by_username(session, username)
+    # Hand the connection back to the pool before the slow part.
+    await session.rollback()
+    stored_hash = user.hashed_password if user is not None else ""
+    # A failure only stands while the stored hash is unchanged, so a user
+    # created or a password reset since, even by python -m app.users in
+    # another process, is verified again.
+    if failed_login_cache.get(key) == stored_hash:
+        return None
+    valid = await password_hasher.verify(password, user.hashed_password if user is not None else None)
+    if user is None or not valid:
+        failed_login_cache.set(key, stored_hash, time.time() + Config.LOGIN_FAILURE_CACHE_SECONDS)
+        return None
+    return user
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -32,6 +178,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -40,4 +189,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    # Tokens without an exp claim never expire, so they are always re-verified.
+    if isinstance(payload.get("exp"), (int, float)):
+        token_cache.set(token, token_data, payload["exp"])
     return token_data
\ No newline at end of file
@@ -0,0 +1,160 @@
+import json
+import time
+from collections import OrderedDict
+from app.utils import logger
+from config.config import Config
+
+class MemoryCacheBackend:
+    """In-process LRU with a TTL; set() never replaces a newer version."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return version, value
+
+    async def set(self, key, value, version: int):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > version and time.monotonic() < entry[2]:
+            return False
+        self._entries[key] = (version, value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return True
+
+    async def delete(self, key):
+        self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+class RedisCacheBackend:
+    """Shared backend for multi-process deployments. Requires the redis package."""
+
+    # Compare-and-set on the stored version so that concurrent writers from
+    # different processes cannot replace a newer value with an older one.
+    SET_IF_NEWER = """
+    local current = redis.call('HGET', KEYS[1], 'version')
+    if current and tonumber(current) > tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'version', ARGV[1], 'value', ARGV[2])
+    redis.call('PEXPIRE', KEYS[1], ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = "bank:account:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._set_if_newer = self.client.register_script(self.SET_IF_NEWER)
+
+    async def get(self, key):
+        version, value = await self.client.hmget(f"{self.prefix}{key}", "version", "value")
+        if version is None:
+            return None
+        return int(version), json.loads(value)
+
+    async def set(self, key, value, version: int):
+        stored = await self._set_if_newer(
+            keys=[f"{self.prefix}{key}"],
+            args=[version, json.dumps(value), int(self.ttl * 1000)],
+        )
+        return bool(stored)
+
+    async def delete(self, key):
+        await self.client.delete(f"{self.prefix}{key}")
+
+    async def clear(self):
+        async for key in self.client.scan_iter(f"{self.prefix}*"):
+            await self.client.delete(key)
+
+class NullCacheBackend:
+    async def get(self, key):
+        return None
+
+    async def set(self, key, value, version: int):
+        return False
+
+    async def delete(self, key):
+        pass
+
+    async def clear(self):
+        pass
+
+class AccountCache:
+    """Account id -> {id, customer_id, balance}, versioned by bank_accounts.version.
+
+    Populated on read and written through by every balance change after it
+    commits. A cache failure never fails the request; it is logged and the
+    caller falls back to the database.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stale_writes = 0
+        self.errors = 0
+
+    async def get(self, account_id: int):
+        try:
+            entry = await self.backend.get(account_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("[Cache] Read failed for account_id=%s: %s", account_id, e)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    async def store(self, rows):
+        for row in rows:
+            value = {"id": row["id"], "customer_id": row["customer_id"], "balance": row["balance"]}
+            try:
+                if not await self.backend.set(row["id"], value, row["version"]):
+                    self.stale_writes += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning("[Cache] Write failed for account_id=%s: %s", row["id"], e)
+
+    async def invalidate(self, account_id: int):
+        try:
+            await self.backend.delete(account_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("[Cache] Invalidate failed for account_id=%s: %s", account_id, e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stale_writes": self.stale_writes,
+            "errors": self.errors,
+        }
+
+def create_account_cache():
+    if Config.ACCOUNT_CACHE_BACKEND == "redis":
+        return AccountCache(RedisCacheBackend(Config.REDIS_URL, Config.ACCOUNT_CACHE_TTL_SECONDS))
+    if Config.ACCOUNT_CACHE_BACKEND == "none":
+        return AccountCache(NullCacheBackend())
+    return AccountCache(MemoryCacheBackend(Config.ACCOUNT_CACHE_SIZE, Config.ACCOUNT_CACHE_TTL_SECONDS))
+
+account_cache = create_account_cache()
@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+from db.database import SessionLocal
+from app.crud import create_balance_checkpoints
+from app.utils import logger
+from config.config import Config
+
+async def run_checkpoints(interval: int = None):
+    while True:
+        async with SessionLocal() as session:
+            created = await create_balance_checkpoints(session)
+        logger.info("[Checkpoints] Created %s balance checkpoints", created)
+        if interval is None:
+            return
+        await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write periodic balance checkpoints for as-of balance queries.")
+    parser.add_argument("--loop", action="store_true", help="keep running every BALANCE_CHECKPOINT_INTERVAL_SECONDS")
+    args = parser.parse_args()
+    asyncio.run(run_checkpoints(Config.BALANCE_CHECKPOINT_INTERVAL_SECONDS if args.loop else None))
+
+if __name__ == "__main__":
+    main()
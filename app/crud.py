@@ -1,21 +1,114 @@
+import asyncio
+import functools
+import random
+from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload, joinedload
-from app.models import Customer, BankAccount, TransferHistory
+from sqlalchemy.orm import selectinload, joinedload, aliased
+from app.models import User, Customer, BankAccount, TransferHistory, LedgerEntry, BalanceCheckpoint, OutboxEvent, DailyAccountSummary
 from fastapi import HTTPException, status
 from sqlalchemy.orm import selectinload
-from sqlalchemy import select, update
+from sqlalchemy import select, update, insert, delete, case, cast, union, union_all, tuple_, and_, exists, literal, true, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy import func
+from datetime import datetime, timedelta
+from config.config import Config
+from app.cache import account_cache
+from app.metrics import transaction_retries, transaction_conflicts
+from app.partitions import archive_horizon, iter_archived_transfers
+
+_account_columns = (BankAccount.id, BankAccount.customer_id, BankAccount.balance, BankAccount.version)
+
+# Accounts that predate the ledger get a backfilled opening entry with id
+# -account_id, so it replays before every entry the account got afterwards.
+# Replays without a checkpoint start below all of those ids.
+_BEFORE_FIRST_ENTRY = -2 ** 31
+
+# PostgreSQL SQLSTATEs after which the whole transaction can simply be run again.
+RETRYABLE_SQLSTATES = {
+    "40P01": "deadlock",
+    "40001": "serialization_failure",
+    "55P03": "lock_not_available",
+}
+
+class TransactionConflict(HTTPException):
+    """A balance transaction kept conflicting with concurrent ones after every retry."""
+
+    def __init__(self, reason: str):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Transaction conflict, please retry",
+            headers={"Retry-After": "1"},
+        )
+        self.reason = reason
+
+def _conflict_reason(error: DBAPIError):
+    orig = error.orig
+    return RETRYABLE_SQLSTATES.get(getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None))
+
+def _retry_delay(attempt: int):
+    # Full jitter keeps transactions that collided once from colliding again in step.
+    return random.uniform(0, min(Config.TRANSACTION_RETRY_MAX_DELAY, Config.TRANSACTION_RETRY_BASE_DELAY * 2 ** attempt))
+
+def _retry_conflicts(operation: str):
+    """Re-runs a balance function whose transaction hit a deadlock or serialization failure.
+
+    The wrapped function must do all of its work inside one transaction, so
+    a failed attempt leaves nothing behind. Gives up with TransactionConflict
+    after TRANSACTION_MAX_RETRIES retries.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(session: AsyncSession, *args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return await function(session, *args, **kwargs)
+                except DBAPIError as e:
+                    reason = _conflict_reason(e)
+                    if reason is None:
+                        raise
+                    if session.in_transaction():
+                        await session.rollback()
+                    if attempt >= Config.TRANSACTION_MAX_RETRIES:
+                        transaction_conflicts.inc(operation, reason)
+                        raise TransactionConflict(reason) from e
+                    transaction_retries.inc(operation, reason)
+                    await asyncio.sleep(_retry_delay(attempt))
+                    attempt += 1
+        return wrapper
+    return decorate
+
+@asynccontextmanager
+async def _balance_transaction(session: AsyncSession):
+    async with session.begin():
+        if Config.TRANSACTION_ISOLATION_LEVEL and _supports_dml_cte(session):
+            # Only applies while the transaction's connection is first checked out.
+            await session.connection(execution_options={"isolation_level": Config.TRANSACTION_ISOLATION_LEVEL})
+        yield
+
+async def get_user_by_username(session: AsyncSession, username: str):
+    result = await session.execute(select(User.id, User.username, User.hashed_password).where(User.username == username))
+    return result.first()
+
+async def create_user(session: AsyncSession, username: str, hashed_password: str):
+    if await get_user_by_username(session, username) is not None:
+        raise HTTPException(status_code=409, detail="Username already exists")
+    user = User(username=username, hashed_password=hashed_password)
+    session.add(user)
+    await session.commit()
+    return user
 
 async def create_customer(session: AsyncSession, name: str):
     new_customer = Customer(name=name)
     session.add(new_customer)
     await session.commit()
-    await session.refresh(new_customer)
     return new_customer
 
 async def check_customer_exists(session: AsyncSession, customer_id: int):
-    result = await session.execute(select(Customer).filter_by(id=customer_id))
+    result = await session.execute(select(Customer.id).where(Customer.id == customer_id))
     return result.scalar_one_or_none()
 
 async def create_bank_account(session: AsyncSession, customer_id: int, initial_deposit: float):
@@ -25,107 +118,981 @@ async def create_bank_account(session: AsyncSession, customer_id: int, initial_d
 
     account = BankAccount(customer_id=customer_id, balance=initial_deposit)
     session.add(account)
+    await session.flush()
+    session.add(LedgerEntry(account_id=account.id, entry_type="opening", amount=initial_deposit))
     await session.commit()
-    await session.refresh(account)
+    await account_cache.store([{
+        "id": account.id, "customer_id": account.customer_id, "balance": account.balance, "version": account.version
+    }])
     return account
 
-async def transfer(session: AsyncSession, from_account_id: int, to_account_id: int, amount: float):
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+async def create_customers_bulk(session: AsyncSession, names: list, chunk_size: int = Config.BULK_INSERT_CHUNK_SIZE):
+    customer_ids = []
     async with session.begin():
-        statement = select(BankAccount).where(BankAccount.id.in_([from_account_id, to_account_id])).with_for_update()
-        results = await session.execute(statement)
-        accounts = results.scalars().all()
+        for _, chunk in _chunks(names, chunk_size):
+            result = await session.execute(
+                insert(Customer).returning(Customer.id, sort_by_parameter_order=True),
+                [{"name": name} for name in chunk],
+            )
+            customer_ids.extend(result.scalars().all())
+    return customer_ids
 
-        if len(accounts) != 2:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+async def create_bank_accounts_bulk(session: AsyncSession, accounts: list, chunk_size: int = Config.BULK_INSERT_CHUNK_SIZE):
+    """Creates accounts chunk by chunk in one transaction; results follow input order."""
+    results = []
+    async with session.begin():
+        for offset, chunk in _chunks(accounts, chunk_size):
+            existing = await session.execute(
+                select(Customer.id).where(Customer.id.in_({item["customer_id"] for item in chunk}))
+            )
+            customer_ids = set(existing.scalars().all())
 
-        account_map = {account.id: account for account in accounts}
-        from_account = account_map[from_account_id]
-        to_account = account_map[to_account_id]
+            valid = []
+            for index, item in enumerate(chunk, start=offset):
+                if item["customer_id"] in customer_ids:
+                    results.append({"index": index, "status": "ok"})
+                    valid.append((results[-1], item))
+                else:
+                    results.append({"index": index, "status": "failed", "detail": "Customer does not exist"})
+            if not valid:
+                continue
 
-        if from_account.balance < amount:
+            inserted = await session.execute(
+                insert(BankAccount).returning(BankAccount.id, sort_by_parameter_order=True),
+                [{"customer_id": item["customer_id"], "balance": item["initial_deposit"]} for _, item in valid],
+            )
+            account_ids = inserted.scalars().all()
+            await session.execute(insert(LedgerEntry), [
+                {"account_id": account_id, "entry_type": "opening", "amount": item["initial_deposit"]}
+                for account_id, (_, item) in zip(account_ids, valid)
+            ])
+            for account_id, (result, _) in zip(account_ids, valid):
+                result["account_id"] = account_id
+    return results
+
+@_retry_conflicts("transfer")
+async def transfer(session: AsyncSession, from_account_id: int, to_account_id: int, amount: float):
+    error = _transfer_error(from_account_id, to_account_id, amount)
+    if error is not None:
+        raise HTTPException(status_code=error[0], detail=error[1])
+
+    async with _balance_transaction(session):
+        if _supports_dml_cte(session):
+            found, transfer_id, timestamp, changed = await _transfer_statement(session, from_account_id, to_account_id, amount)
+        else:
+            balances = await _lock_balances(session, {from_account_id, to_account_id})
+            found = len(balances)
+            transfer_id = timestamp = None
+            changed = []
+            if found == 2 and balances[from_account_id] >= amount:
+                changed = await _apply_balance_deltas(session, {from_account_id: -amount, to_account_id: amount})
+                record = {"from_account_id": from_account_id, "to_account_id": to_account_id, "amount": amount}
+                transfer_id, = await _insert_transfers(session, [record])
+                entries = _transfer_ledger_entries(transfer_id, **record)
+                await session.execute(insert(LedgerEntry), entries)
+                await session.execute(insert(OutboxEvent), _outbox_rows(changed))
+                await _record_rollups(session, entries)
+
+        if found != 2:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+        if transfer_id is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient funds")
 
-        from_account.balance -= amount
-        to_account.balance += amount
+    await account_cache.store(changed)
+    return TransferHistory(
+        id=transfer_id,
+        from_account_id=from_account_id,
+        to_account_id=to_account_id,
+        amount=amount,
+        timestamp=timestamp
+    )
+
+def _supports_dml_cte(session: AsyncSession):
+    return session.bind.dialect.name == "postgresql"
+
+def _ledger_clock():
+    # Evaluated after the row locks are held, so per-account ledger order
+    # matches the order in which balance changes were applied.
+    return func.timezone("utc", func.clock_timestamp())
 
-        transfer_record = TransferHistory(
-            from_account_id=from_account_id,
-            to_account_id=to_account_id,
-            amount=amount,
-            timestamp=func.now()
+async def _transfer_statement(session: AsyncSession, from_account_id: int, to_account_id: int, amount: float):
+    """Lock, debit, credit and record a transfer in one round trip (PostgreSQL)."""
+    # Both rows are locked up front in id order; the updates below only touch
+    # rows this statement already holds.
+    locked = (
+        select(BankAccount.id)
+        .where(BankAccount.id.in_([from_account_id, to_account_id]))
+        .order_by(BankAccount.id)
+        .with_for_update(nowait=Config.TRANSACTION_LOCK_NOWAIT)
+        .cte("locked")
+    )
+    found = select(func.count()).select_from(locked).scalar_subquery()
+    debit = (
+        update(BankAccount)
+        .where(BankAccount.id == from_account_id, BankAccount.balance >= amount, found == 2)
+        .values(balance=BankAccount.balance - amount, version=BankAccount.version + 1)
+        .returning(*_account_columns)
+        .cte("debit")
+    )
+    credit = (
+        update(BankAccount)
+        .where(BankAccount.id == to_account_id, exists(select(debit.c.id)))
+        .values(balance=BankAccount.balance + amount, version=BankAccount.version + 1)
+        .returning(*_account_columns)
+        .cte("credit")
+    )
+    record = (
+        insert(TransferHistory)
+        .from_select(
+            ["from_account_id", "to_account_id", "amount", "timestamp"],
+            select(literal(from_account_id), literal(to_account_id), literal(amount), _ledger_clock())
+            .where(exists(select(credit.c.id))),
+        )
+        .returning(TransferHistory.id, TransferHistory.timestamp)
+        .cte("record")
+    )
+    ledger = (
+        insert(LedgerEntry)
+        .from_select(
+            ["account_id", "entry_type", "amount", "transfer_id", "timestamp"],
+            union_all(
+                select(literal(from_account_id), literal("transfer_out"), literal(-amount), record.c.id, _ledger_clock()),
+                select(literal(to_account_id), literal("transfer_in"), literal(amount), record.c.id, _ledger_clock()),
+            ),
         )
-        session.add(transfer_record)
-    return transfer_record
+        .cte("ledger")
+    )
+    events = _outbox_insert(debit, credit)
+    rollups = _rollup_insert((debit, -amount, "transfer_out"), (credit, amount, "transfer_in"))
+    columns = [
+        found.label("found"),
+        select(record.c.id).scalar_subquery().label("transfer_id"),
+        select(record.c.timestamp).scalar_subquery().label("timestamp"),
+    ]
+    for side, changed in (("from", debit), ("to", credit)):
+        for name in ("customer_id", "balance", "version"):
+            columns.append(select(changed.c[name]).scalar_subquery().label(f"{side}_{name}"))
+    row = (await session.execute(select(*columns).add_cte(ledger, events, rollups))).one()
 
-async def get_balance(session: AsyncSession, account_id: int):
-    account = await session.get(BankAccount, account_id)
-    if account is None:
-        raise HTTPException(status_code=404, detail="Account not found")
-    return account.balance
+    changed = []
+    if row.transfer_id is not None:
+        for side, account_id in (("from", from_account_id), ("to", to_account_id)):
+            changed.append({
+                "id": account_id,
+                "customer_id": row._mapping[f"{side}_customer_id"],
+                "balance": row._mapping[f"{side}_balance"],
+                "version": row._mapping[f"{side}_version"],
+            })
+    return row.found, row.transfer_id, row.timestamp, changed
+
+async def _apply_balance_change(session: AsyncSession, account_id: int, change: float, entry_type: str, minimum_balance: float = None):
+    """Conditionally apply a balance change and write its ledger entry.
+
+    Returns the account's new (id, customer_id, balance, version) row, or None
+    when the account does not exist or its balance is below minimum_balance.
+    """
+    applied = update(BankAccount).where(BankAccount.id == account_id)
+    if minimum_balance is not None:
+        applied = applied.where(BankAccount.balance >= minimum_balance)
+    applied = applied.values(
+        balance=BankAccount.balance + change, version=BankAccount.version + 1
+    ).returning(*_account_columns)
+
+    if _supports_dml_cte(session):
+        applied = applied.cte("applied")
+        entry = insert(LedgerEntry).from_select(
+            ["account_id", "entry_type", "amount", "timestamp"],
+            select(applied.c.id, literal(entry_type), literal(change), _ledger_clock()),
+        ).cte("entry")
+        rollups = _rollup_insert((applied, change, entry_type))
+        result = await session.execute(select(*applied.c).add_cte(entry, _outbox_insert(applied), rollups))
+        return result.first()
 
-async def get_transfer_history(session: AsyncSession, account_id: int):
-    query = select(TransferHistory).where(
-        (TransferHistory.from_account_id == account_id) |
-        (TransferHistory.to_account_id == account_id)
+    row = (await session.execute(applied)).first()
+    if row is not None:
+        entry = {"account_id": account_id, "entry_type": entry_type, "amount": change}
+        await session.execute(insert(LedgerEntry).values(**entry))
+        await session.execute(insert(OutboxEvent), _outbox_rows([row._asdict()]))
+        await _record_rollups(session, [entry])
+    return row
+
+def _outbox_insert(*changed_ctes):
+    """Outbox rows for the accounts a DML CTE returned, as another CTE (PostgreSQL)."""
+    return insert(OutboxEvent).from_select(
+        ["account_id", "event_type", "balance", "version", "timestamp"],
+        union_all(*(
+            select(changed.c.id, literal("balance_changed"), changed.c.balance, changed.c.version, _ledger_clock())
+            for changed in changed_ctes
+        )),
+    ).cte("events")
+
+_rollup_counters = {
+    "transfer_in": "transfers_in",
+    "transfer_out": "transfers_out",
+    "deposit": "deposits",
+    "withdrawal": "withdrawals",
+}
+_rollup_columns = ("inflow", "outflow", "transfers_in", "transfers_out", "deposits", "withdrawals")
+
+def _on_rollup_conflict(statement):
+    # Rows are keyed by (account_id, day), so the upsert only touches the
+    # rollup rows of accounts whose balance rows are already locked.
+    return statement.on_conflict_do_update(
+        index_elements=["account_id", "day"],
+        set_={name: getattr(DailyAccountSummary, name) + statement.excluded[name] for name in _rollup_columns},
     )
+
+def _rollup_insert(*changes):
+    """Rollup upsert for (changed CTE, amount, entry_type) changes, as another CTE (PostgreSQL)."""
+    day = cast(_ledger_clock(), Date)
+    sources = []
+    for changed, amount, entry_type in changes:
+        counters = [literal(int(_rollup_counters[entry_type] == name)) for name in _rollup_columns[2:]]
+        sources.append(select(changed.c.id, day, literal(max(amount, 0.0)), literal(max(-amount, 0.0)), *counters))
+    statement = pg_insert(DailyAccountSummary).from_select(["account_id", "day", *_rollup_columns], union_all(*sources))
+    return _on_rollup_conflict(statement).cte("rollups")
+
+def _rollup_rows(entries: list, day):
+    rows = {}
+    for entry in entries:
+        account_id = entry["account_id"]
+        if account_id not in rows:
+            rows[account_id] = {"account_id": account_id, "day": day, **dict.fromkeys(_rollup_columns, 0)}
+        row = rows[account_id]
+        if entry["amount"] >= 0:
+            row["inflow"] += entry["amount"]
+        else:
+            row["outflow"] -= entry["amount"]
+        row[_rollup_counters[entry["entry_type"]]] += 1
+    return [rows[account_id] for account_id in sorted(rows)]
+
+async def _record_rollups(session: AsyncSession, entries: list):
+    upsert = pg_insert if _supports_dml_cte(session) else sqlite_insert
+    statement = upsert(DailyAccountSummary).values(_rollup_rows(entries, datetime.utcnow().date()))
+    await session.execute(_on_rollup_conflict(statement))
+
+def _outbox_rows(changed: list):
+    return [
+        {"account_id": row["id"], "event_type": "balance_changed", "balance": row["balance"], "version": row["version"]}
+        for row in changed
+    ]
+
+async def _account_exists(session: AsyncSession, account_id: int):
+    result = await session.execute(select(BankAccount.id).where(BankAccount.id == account_id))
+    return result.scalar_one_or_none() is not None
+
+async def get_balance(session: AsyncSession, account_id: int):
+    account = await get_account_details(session, account_id)
+    return account["balance"]
+
+def _keyset_page(query, model, limit: int, before=None, after=None, start_date=None, end_date=None):
+    if start_date is not None:
+        query = query.where(model.timestamp >= start_date)
+    if end_date is not None:
+        query = query.where(model.timestamp < end_date)
+    if before is not None:
+        query = query.where(model.timestamp <= before[0], tuple_(model.timestamp, model.id) < tuple_(*before))
+    if after is not None:
+        query = query.where(model.timestamp >= after[0], tuple_(model.timestamp, model.id) > tuple_(*after))
+    if after is None:
+        query = query.order_by(model.timestamp.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.timestamp, model.id)
+    return query.limit(limit)
+
+def _account_transfers_query(account_id: int, limit: int, before=None, after=None, start_date=None, end_date=None):
+    # Each side of the UNION is served by its own (account, timestamp) index
+    # and stops after `limit` rows, so a page never scans the full history.
+    descending = after is None
+
+    def side(column):
+        query = select(TransferHistory).where(column == account_id)
+        query = _keyset_page(query, TransferHistory, limit, before, after, start_date, end_date)
+        return select(query.subquery())
+
+    page = union(side(TransferHistory.from_account_id), side(TransferHistory.to_account_id)).subquery()
+    row = aliased(TransferHistory, page)
+    if descending:
+        order = (row.timestamp.desc(), row.id.desc())
+    else:
+        order = (row.timestamp, row.id)
+    return select(row).order_by(*order).limit(limit), descending
+
+async def get_transfer_history(session: AsyncSession, account_id: int, limit: int = 100, before=None, after=None, start_date=None, end_date=None):
+    query, descending = _account_transfers_query(account_id, limit, before, after, start_date, end_date)
     result = await session.execute(query)
-    return result.scalars().all()
+    history = result.scalars().all()
+    return history if descending else history[::-1]
 
 
+@_retry_conflicts("deposit")
 async def deposit_funds(session: AsyncSession, account_id: int, amount: float):
-    async with session.begin():
-        account = await session.get(BankAccount, account_id)
-        
-        if not account:
-            raise HTTPException(status_code=404, detail="Account not found")
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Deposit amount must be positive")
 
-        if amount <= 0:
-            raise HTTPException(status_code=400, detail="Deposit amount must be positive")
+    async with _balance_transaction(session):
+        row = await _apply_balance_change(session, account_id, amount, "deposit")
+        if row is None:
+            raise HTTPException(status_code=404, detail="Account not found")
 
-        account.balance += amount
-        session.add(account)
-
-    return account
+    await account_cache.store([row._asdict()])
+    return BankAccount(id=row.id, customer_id=row.customer_id, balance=row.balance)
 
+@_retry_conflicts("withdraw")
 async def withdraw_funds(session: AsyncSession, account_id: int, amount: float):
-    async with session.begin():
-        account = await session.get(BankAccount, account_id)
-        
-        if not account:
-            raise HTTPException(status_code=404, detail="Account not found")
-        
-        if amount <= 0:
-            raise HTTPException(status_code=400, detail="Withdrawal amount must be positive")
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Withdrawal amount must be positive")
 
-        if account.balance < amount:
+    async with _balance_transaction(session):
+        row = await _apply_balance_change(session, account_id, -amount, "withdrawal", minimum_balance=amount)
+        if row is None:
+            if not await _account_exists(session, account_id):
+                raise HTTPException(status_code=404, detail="Account not found")
             raise HTTPException(status_code=400, detail="Insufficient funds")
 
-        account.balance -= amount
-        session.add(account)
-
-    return account
+    await account_cache.store([row._asdict()])
+    return BankAccount(id=row.id, customer_id=row.customer_id, balance=row.balance)
 
 async def get_account_details(session: AsyncSession, account_id: int):
-    account = await session.get(BankAccount, account_id)
-    
-    if not account:
+    account = await account_cache.get(account_id)
+    if account is not None:
+        return account
+
+    result = await session.execute(select(*_account_columns).where(BankAccount.id == account_id))
+    row = result.first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    return account
+    await account_cache.store([row._asdict()])
+    return {"id": row.id, "customer_id": row.customer_id, "balance": row.balance}
 
 async def list_customer_accounts(session: AsyncSession, customer_id: int):
     result = await session.execute(
-        select(BankAccount).where(BankAccount.customer_id == customer_id)
+        select(*_account_columns).where(BankAccount.customer_id == customer_id).order_by(BankAccount.id)
+    )
+    rows = [row._asdict() for row in result.all()]
+    await account_cache.store(rows)
+
+    return [{"id": row["id"], "customer_id": row["customer_id"], "balance": row["balance"]} for row in rows]
+
+async def get_accounts(session: AsyncSession, account_ids: list):
+    """Looks up many accounts at once: cache first, then one query for the rest.
+
+    Returns the accounts found, in the order requested, and the ids that do not exist.
+    """
+    account_ids = list(dict.fromkeys(account_ids))
+    cached = await asyncio.gather(*(account_cache.get(account_id) for account_id in account_ids))
+    found = {account["id"]: account for account in cached if account is not None}
+    misses = [account_id for account_id in account_ids if account_id not in found]
+    if misses:
+        result = await session.execute(select(*_account_columns).where(BankAccount.id.in_(misses)))
+        rows = [row._asdict() for row in result.all()]
+        await account_cache.store(rows)
+        for row in rows:
+            found[row["id"]] = {"id": row["id"], "customer_id": row["customer_id"], "balance": row["balance"]}
+    return {
+        "accounts": [found[account_id] for account_id in account_ids if account_id in found],
+        "missing": [account_id for account_id in account_ids if account_id not in found],
+    }
+
+_transfer_columns = (TransferHistory.id, TransferHistory.from_account_id, TransferHistory.to_account_id, TransferHistory.amount, TransferHistory.timestamp)
+
+def _recent_transfers_lateral(account_ids: list, limit: int):
+    # For each account, the newest `limit` transfers from each side are read
+    # off the (account, timestamp) indexes, as in the history endpoint.
+    account = BankAccount.__table__.alias("account")
+
+    def side(column):
+        return (
+            select(*_transfer_columns)
+            .where(column == account.c.id)
+            .order_by(TransferHistory.timestamp.desc(), TransferHistory.id.desc())
+            .limit(limit)
+            .correlate(account)
+        )
+
+    both = union(side(TransferHistory.from_account_id), side(TransferHistory.to_account_id)).subquery("both_sides")
+    recent = (
+        select(both)
+        .order_by(both.c.timestamp.desc(), both.c.id.desc())
+        .limit(limit)
+        .lateral("recent")
+    )
+    return (
+        select(account.c.id.label("account_id"), *recent.c)
+        .select_from(account.join(recent, true()))
+        .where(account.c.id.in_(account_ids))
+        .order_by(account.c.id, recent.c.timestamp.desc(), recent.c.id.desc())
+    )
+
+def _recent_transfers_ranked(account_ids: list, limit: int):
+    sides = union_all(*(
+        select(column.label("account_id"), *_transfer_columns).where(column.in_(account_ids))
+        for column in (TransferHistory.from_account_id, TransferHistory.to_account_id)
+    )).subquery("both_sides")
+    ranked = select(
+        sides,
+        func.row_number().over(
+            partition_by=sides.c.account_id, order_by=(sides.c.timestamp.desc(), sides.c.id.desc())
+        ).label("position"),
+    ).subquery("ranked")
+    return (
+        select(*(ranked.c[name] for name in ("account_id", "id", "from_account_id", "to_account_id", "amount", "timestamp")))
+        .where(ranked.c.position <= limit)
+        .order_by(ranked.c.account_id, ranked.c.position)
+    )
+
+async def get_customer_portfolio(session: AsyncSession, customer_id: int, transfers_per_account: int = Config.PORTFOLIO_RECENT_TRANSFERS):
+    """A customer's accounts, total balance and each account's latest transfers in two queries."""
+    accounts = await list_customer_accounts(session, customer_id)
+    if not accounts and await check_customer_exists(session, customer_id) is None:
+        raise HTTPException(status_code=404, detail="Customer does not exist")
+
+    recent = {account["id"]: [] for account in accounts}
+    if accounts and transfers_per_account > 0:
+        build = _recent_transfers_lateral if _supports_dml_cte(session) else _recent_transfers_ranked
+        result = await session.execute(build(list(recent), transfers_per_account))
+        for row in result.mappings():
+            recent[row["account_id"]].append({
+                "id": row["id"],
+                "from_account_id": row["from_account_id"],
+                "to_account_id": row["to_account_id"],
+                "amount": row["amount"],
+                "timestamp": row["timestamp"],
+            })
+    return {
+        "customer_id": customer_id,
+        "total_balance": sum(account["balance"] for account in accounts),
+        "accounts": [{**account, "recent_transfers": recent[account["id"]]} for account in accounts],
+    }
+
+async def get_account_statements(session: AsyncSession, account_id: int, limit: int = 100, before=None, after=None, start_date=None, end_date=None):
+    query = _keyset_page(
+        select(LedgerEntry).where(LedgerEntry.account_id == account_id),
+        LedgerEntry, limit, before, after, start_date, end_date
+    )
+    result = await session.execute(query)
+    statement = result.scalars().all()
+    if after is not None:
+        statement = statement[::-1]
+    if not statement:
+        return statement
+
+    first_id = min(entry.id for entry in statement)
+    last_id = max(entry.id for entry in statement)
+    opening_balance, checkpoint_entry_id = await _latest_checkpoint(
+        session, account_id, BalanceCheckpoint.ledger_entry_id < first_id
+    )
+    # Replay only from the nearest checkpoint below the page, not from the
+    # first entry the account ever had.
+    replay = select(
+        LedgerEntry.id,
+        (opening_balance + func.sum(LedgerEntry.amount).over(order_by=LedgerEntry.id)).label("running_balance"),
+    ).where(
+        LedgerEntry.account_id == account_id,
+        LedgerEntry.id > checkpoint_entry_id,
+        LedgerEntry.id <= last_id,
+    ).subquery()
+    result = await session.execute(select(replay).where(replay.c.id >= first_id))
+    running_balances = dict(result.all())
+    for entry in statement:
+        entry.running_balance = running_balances[entry.id]
+    return statement
+
+async def stream_statement_entries(session: AsyncSession, start_date=None, end_date=None, account_ids=None, shard: int = None, shards: int = 1, batch_size: int = Config.STATEMENT_EXPORT_BATCH_SIZE):
+    """Yields ledger entries with running balances in one ordered pass.
+
+    Rows come from a server-side cursor ordered by (account_id, id), so
+    entries of one account are contiguous and memory stays flat however
+    many accounts are exported.
+    """
+    def accounts(column):
+        conditions = []
+        if account_ids is not None:
+            conditions.append(column.in_(account_ids))
+        if shard is not None:
+            conditions.append(column % shards == shard)
+        return conditions
+
+    replay = select(
+        LedgerEntry.id, LedgerEntry.account_id, LedgerEntry.entry_type, LedgerEntry.amount,
+        LedgerEntry.transfer_id, LedgerEntry.timestamp,
+    ).where(*accounts(LedgerEntry.account_id))
+    opening_balance = literal(0.0)
+    if start_date is not None:
+        # Start each account from its last checkpoint before the range; a
+        # checkpoint's timestamp is that of the newest entry it covers.
+        latest = select(
+            BalanceCheckpoint.account_id,
+            func.max(BalanceCheckpoint.ledger_entry_id).label("ledger_entry_id"),
+        ).where(
+            BalanceCheckpoint.timestamp < start_date, *accounts(BalanceCheckpoint.account_id)
+        ).group_by(BalanceCheckpoint.account_id).subquery()
+        previous = select(BalanceCheckpoint).join(
+            latest,
+            and_(
+                BalanceCheckpoint.account_id == latest.c.account_id,
+                BalanceCheckpoint.ledger_entry_id == latest.c.ledger_entry_id,
+            ),
+        ).subquery()
+        replay = replay.outerjoin(previous, previous.c.account_id == LedgerEntry.account_id).where(
+            LedgerEntry.id > func.coalesce(previous.c.ledger_entry_id, _BEFORE_FIRST_ENTRY)
+        )
+        opening_balance = func.coalesce(previous.c.balance, 0)
+    if end_date is not None:
+        replay = replay.where(LedgerEntry.timestamp < end_date)
+    replay = replay.add_columns((
+        opening_balance + func.sum(LedgerEntry.amount).over(partition_by=LedgerEntry.account_id, order_by=LedgerEntry.id)
+    ).label("running_balance")).subquery()
+
+    query = select(replay)
+    if start_date is not None:
+        query = query.where(replay.c.timestamp >= start_date)
+    query = query.order_by(replay.c.account_id, replay.c.id).execution_options(yield_per=batch_size)
+    result = await session.stream(query)
+    async for row in result.mappings():
+        yield row
+
+async def stream_transfer_rows(session: AsyncSession, start_date=None, end_date=None, account_ids=None, shard: int = None, shards: int = 1, batch_size: int = Config.STATEMENT_EXPORT_BATCH_SIZE):
+    """Yields transfers in (timestamp, id) order, archived months first.
+
+    A transfer is included when either side matches the account filter, so
+    it shows up in the export of both accounts' shards.
+    """
+    wanted = set(account_ids) if account_ids is not None else None
+
+    def matches(from_account_id, to_account_id):
+        for account_id in (from_account_id, to_account_id):
+            if wanted is not None and account_id not in wanted:
+                continue
+            if shard is not None and account_id % shards != shard:
+                continue
+            return True
+        return False
+
+    horizon = await asyncio.to_thread(archive_horizon)
+    if horizon is not None and (start_date is None or start_date < horizon):
+        async for row in iter_archived_transfers(
+            start_date, min(end_date, horizon) if end_date is not None else horizon,
+            lambda row: matches(row["from_account_id"], row["to_account_id"]),
+        ):
+            yield row
+        if end_date is not None and end_date <= horizon:
+            return
+        start_date = horizon
+
+    def side(column):
+        conditions = []
+        if account_ids is not None:
+            conditions.append(column.in_(account_ids))
+        if shard is not None:
+            conditions.append(column % shards == shard)
+        return and_(*conditions)
+
+    query = select(
+        TransferHistory.id, TransferHistory.from_account_id, TransferHistory.to_account_id,
+        TransferHistory.amount, TransferHistory.timestamp,
+    )
+    if account_ids is not None or shard is not None:
+        query = query.where(side(TransferHistory.from_account_id) | side(TransferHistory.to_account_id))
+    if start_date is not None:
+        query = query.where(TransferHistory.timestamp >= start_date)
+    if end_date is not None:
+        query = query.where(TransferHistory.timestamp < end_date)
+    query = query.order_by(TransferHistory.timestamp, TransferHistory.id).execution_options(yield_per=batch_size)
+    result = await session.stream(query)
+    async for row in result.mappings():
+        yield row
+
+def _summary_totals(rows):
+    totals = dict.fromkeys(_rollup_columns, 0)
+    for row in rows:
+        for name in _rollup_columns:
+            totals[name] += row[name]
+    totals["net"] = totals["inflow"] - totals["outflow"]
+    return totals
+
+def _summary_days(query, start_day=None, end_day=None):
+    if start_day is not None:
+        query = query.where(DailyAccountSummary.day >= start_day)
+    if end_day is not None:
+        query = query.where(DailyAccountSummary.day <= end_day)
+    return query
+
+async def get_account_summary(session: AsyncSession, account_id: int, start_day=None, end_day=None):
+    if not await _account_exists(session, account_id):
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    result = await session.execute(_summary_days(
+        select(DailyAccountSummary.day, *(getattr(DailyAccountSummary, name) for name in _rollup_columns))
+        .where(DailyAccountSummary.account_id == account_id)
+        .order_by(DailyAccountSummary.day),
+        start_day, end_day,
+    ))
+    days = [row._asdict() for row in result.all()]
+    return {"account_id": account_id, "totals": _summary_totals(days), "days": days}
+
+async def get_customer_summary(session: AsyncSession, customer_id: int, start_day=None, end_day=None):
+    if await check_customer_exists(session, customer_id) is None:
+        raise HTTPException(status_code=404, detail="Customer does not exist")
+
+    conditions = [DailyAccountSummary.account_id == BankAccount.id]
+    if start_day is not None:
+        conditions.append(DailyAccountSummary.day >= start_day)
+    if end_day is not None:
+        conditions.append(DailyAccountSummary.day <= end_day)
+    result = await session.execute(
+        select(BankAccount.id.label("account_id"), *(
+            func.coalesce(func.sum(getattr(DailyAccountSummary, name)), 0).label(name) for name in _rollup_columns
+        ))
+        .outerjoin(DailyAccountSummary, and_(*conditions))
+        .where(BankAccount.customer_id == customer_id)
+        .group_by(BankAccount.id)
+        .order_by(BankAccount.id)
     )
-    accounts = result.scalars().all()
-    
-    return accounts
+    accounts = []
+    for row in result.all():
+        totals = _summary_totals([row._mapping])
+        accounts.append({"account_id": row.account_id, "totals": totals})
+    return {
+        "customer_id": customer_id,
+        "totals": _summary_totals([account["totals"] for account in accounts]),
+        "accounts": accounts,
+    }
+
+async def rebuild_daily_summaries(session: AsyncSession, start_day=None, end_day=None):
+    """Recomputes rollups for [start_day, end_day] from the ledger.
+
+    Transfers recorded before the ledger existed have no ledger entries, so
+    those are taken from transfer_history directly.
+    """
+    def in_range(query, timestamp):
+        if start_day is not None:
+            query = query.where(timestamp >= start_day)
+        if end_day is not None:
+            query = query.where(timestamp < end_day + timedelta(days=1))
+        return query
+
+    unledgered = ~exists().where(LedgerEntry.transfer_id == TransferHistory.id)
+    movements = union_all(
+        in_range(select(
+            LedgerEntry.account_id, func.date(LedgerEntry.timestamp).label("day"),
+            LedgerEntry.amount, LedgerEntry.entry_type,
+        ).where(LedgerEntry.entry_type != "opening"), LedgerEntry.timestamp),
+        in_range(select(
+            TransferHistory.from_account_id, func.date(TransferHistory.timestamp),
+            -TransferHistory.amount, literal("transfer_out"),
+        ).where(unledgered), TransferHistory.timestamp),
+        in_range(select(
+            TransferHistory.to_account_id, func.date(TransferHistory.timestamp),
+            TransferHistory.amount, literal("transfer_in"),
+        ).where(unledgered), TransferHistory.timestamp),
+    ).subquery()
 
-async def get_account_statements(session: AsyncSession, account_id: int):
+    def count(entry_type):
+        return func.sum(case((movements.c.entry_type == entry_type, 1), else_=0))
+
+    aggregated = select(
+        movements.c.account_id,
+        movements.c.day,
+        func.sum(case((movements.c.amount > 0, movements.c.amount), else_=0)),
+        func.sum(case((movements.c.amount < 0, -movements.c.amount), else_=0)),
+        *(count(entry_type) for entry_type in _rollup_counters),
+    ).group_by(movements.c.account_id, movements.c.day)
+
+    async with session.begin():
+        await session.execute(_summary_days(delete(DailyAccountSummary), start_day, end_day))
+        result = await session.execute(
+            insert(DailyAccountSummary).from_select(["account_id", "day", *_rollup_columns], aggregated)
+        )
+    return result.rowcount
+
+async def _latest_checkpoint(session: AsyncSession, account_id: int, condition):
+    result = await session.execute(
+        select(BalanceCheckpoint.balance, BalanceCheckpoint.ledger_entry_id)
+        .where(BalanceCheckpoint.account_id == account_id, condition)
+        .order_by(BalanceCheckpoint.ledger_entry_id.desc())
+        .limit(1)
+    )
+    checkpoint = result.first()
+    if checkpoint is None:
+        return 0, _BEFORE_FIRST_ENTRY
+    return checkpoint.balance, checkpoint.ledger_entry_id
+
+async def get_balance_as_of(session: AsyncSession, account_id: int, as_of: datetime):
+    if not await _account_exists(session, account_id):
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    opening_balance, checkpoint_entry_id = await _latest_checkpoint(
+        session, account_id, BalanceCheckpoint.timestamp <= as_of
+    )
     result = await session.execute(
-        select(TransferHistory).where(
-            (TransferHistory.from_account_id == account_id) | 
-            (TransferHistory.to_account_id == account_id)
-        ).order_by(TransferHistory.timestamp.desc())
+        select(func.coalesce(func.sum(LedgerEntry.amount), 0)).where(
+            LedgerEntry.account_id == account_id,
+            LedgerEntry.id > checkpoint_entry_id,
+            LedgerEntry.timestamp <= as_of,
+        )
     )
-    return result.scalars().all()
\ No newline at end of file
+    return opening_balance + result.scalar_one()
+
+async def create_balance_checkpoints(session: AsyncSession, min_entries: int = Config.BALANCE_CHECKPOINT_MIN_ENTRIES):
+    # Entries younger than the settle window may still belong to transactions
+    # that have not committed yet; checkpointing past them would skip them.
+    settled_before = datetime.utcnow() - timedelta(seconds=Config.BALANCE_CHECKPOINT_SETTLE_SECONDS)
+    latest = select(
+        BalanceCheckpoint.account_id,
+        func.max(BalanceCheckpoint.ledger_entry_id).label("ledger_entry_id"),
+    ).group_by(BalanceCheckpoint.account_id).subquery()
+    previous = select(BalanceCheckpoint).join(
+        latest,
+        and_(
+            BalanceCheckpoint.account_id == latest.c.account_id,
+            BalanceCheckpoint.ledger_entry_id == latest.c.ledger_entry_id,
+        ),
+    ).subquery()
+    pending = select(
+        LedgerEntry.account_id,
+        func.max(LedgerEntry.id),
+        func.coalesce(previous.c.balance, 0) + func.sum(LedgerEntry.amount),
+        func.max(LedgerEntry.timestamp),
+    ).outerjoin(
+        previous, previous.c.account_id == LedgerEntry.account_id
+    ).where(
+        LedgerEntry.id > func.coalesce(previous.c.ledger_entry_id, _BEFORE_FIRST_ENTRY),
+        LedgerEntry.timestamp < settled_before,
+    ).group_by(
+        LedgerEntry.account_id, previous.c.balance
+    ).having(func.count() >= min_entries)
+
+    async with session.begin():
+        result = await session.execute(
+            insert(BalanceCheckpoint).from_select(["account_id", "ledger_entry_id", "balance", "timestamp"], pending)
+        )
+    return result.rowcount
+
+async def backfill_opening_entries(session: AsyncSession, chunk_size: int = Config.BULK_INSERT_CHUNK_SIZE):
+    """Writes an opening ledger entry for every account that has none.
+
+    Accounts created before the ledger existed carry a balance no entry
+    explains. Each one gets an opening entry for its balance less the entries
+    it has recorded since, dated at its first entry (or now), and its stale
+    checkpoints are dropped. Runs chunk by chunk with the accounts locked, so
+    it is safe while the app is serving; returns how many accounts it fixed.
+    """
+    backfilled = 0
+    last_id = _BEFORE_FIRST_ENTRY
+    while True:
+        async with session.begin():
+            result = await session.execute(
+                select(BankAccount.id, BankAccount.balance)
+                .where(
+                    BankAccount.id > last_id,
+                    ~exists().where(LedgerEntry.account_id == BankAccount.id, LedgerEntry.entry_type == "opening"),
+                )
+                .order_by(BankAccount.id)
+                .limit(chunk_size)
+                .with_for_update()
+            )
+            balances = dict(result.all())
+            if not balances:
+                return backfilled
+            recorded = await session.execute(
+                select(LedgerEntry.account_id, func.sum(LedgerEntry.amount), func.min(LedgerEntry.timestamp))
+                .where(LedgerEntry.account_id.in_(list(balances)))
+                .group_by(LedgerEntry.account_id)
+            )
+            since = {account_id: (total, first) for account_id, total, first in recorded.all()}
+            now = datetime.utcnow()
+            entries = []
+            for account_id, balance in balances.items():
+                total, first = since.get(account_id, (0, now))
+                entries.append({
+                    "id": -account_id, "account_id": account_id, "entry_type": "opening",
+                    "amount": (balance or 0) - total, "timestamp": first,
+                })
+            await session.execute(delete(BalanceCheckpoint).where(BalanceCheckpoint.account_id.in_(list(balances))))
+            await session.execute(insert(LedgerEntry), entries)
+        backfilled += len(balances)
+        last_id = max(balances)
+
+@_retry_conflicts("transfer_batch")
+async def transfer_batch(session: AsyncSession, transfers: list, atomic: bool = True):
+    account_ids = {t["from_account_id"] for t in transfers} | {t["to_account_id"] for t in transfers}
+    results = []
+    async with _balance_transaction(session):
+        balances = await _lock_balances(session, account_ids)
+
+        deltas = {}
+        records = []
+        for index, item in enumerate(transfers):
+            from_account_id = item["from_account_id"]
+            to_account_id = item["to_account_id"]
+            amount = item["amount"]
+
+            error = _transfer_error(from_account_id, to_account_id, amount, balances)
+            if error is not None:
+                if atomic:
+                    raise HTTPException(status_code=error[0], detail=f"Transfer {index}: {error[1]}")
+                results.append({"index": index, "status": "failed", "detail": error[1]})
+                continue
+
+            _move_funds(balances, deltas, from_account_id, to_account_id, amount)
+            records.append({"from_account_id": from_account_id, "to_account_id": to_account_id, "amount": amount})
+            results.append({"index": index, "status": "ok"})
+
+        changed = []
+        if records:
+            changed = await _apply_balance_deltas(session, deltas)
+            transfer_ids = await _insert_transfers(session, records)
+            entries = []
+            for transfer_id, record in zip(transfer_ids, records):
+                entries.extend(_transfer_ledger_entries(transfer_id, **record))
+            await session.execute(insert(LedgerEntry), entries)
+            await session.execute(insert(OutboxEvent), _outbox_rows(changed))
+            await _record_rollups(session, entries)
+            transfer_ids = iter(transfer_ids)
+            for result in results:
+                if result["status"] == "ok":
+                    result["transfer_id"] = next(transfer_ids)
+    await account_cache.store(changed)
+    return results
+
+@_retry_conflicts("sequencer_batch")
+async def apply_operations(session: AsyncSession, operations: list):
+    """Apply deposits, withdrawals and transfers in one transaction.
+
+    Each operation is validated exactly like deposit_funds, withdraw_funds and
+    transfer. The result list holds, per operation, either the object those
+    functions would return or the HTTPException they would raise.
+    """
+    account_ids = set()
+    for operation in operations:
+        if operation["kind"] == "transfer":
+            account_ids.update((operation["from_account_id"], operation["to_account_id"]))
+        else:
+            account_ids.add(operation["account_id"])
+
+    results = []
+    async with _balance_transaction(session):
+        balances = await _lock_balances(session, account_ids)
+
+        deltas = {}
+        records = []
+        for operation in operations:
+            kind = operation["kind"]
+            amount = operation["amount"]
+            if kind == "transfer":
+                from_account_id = operation["from_account_id"]
+                to_account_id = operation["to_account_id"]
+                error = _transfer_error(from_account_id, to_account_id, amount, balances)
+                if error is not None:
+                    results.append(HTTPException(status_code=error[0], detail=error[1]))
+                else:
+                    _move_funds(balances, deltas, from_account_id, to_account_id, amount)
+                    record = {"from_account_id": from_account_id, "to_account_id": to_account_id, "amount": amount}
+                    records.append(record)
+                    results.append(record)
+                continue
+
+            account_id = operation["account_id"]
+            if account_id not in balances:
+                results.append(HTTPException(status_code=404, detail="Account not found"))
+            elif amount <= 0:
+                label = "Deposit" if kind == "deposit" else "Withdrawal"
+                results.append(HTTPException(status_code=400, detail=f"{label} amount must be positive"))
+            elif kind == "withdraw" and balances[account_id] < amount:
+                results.append(HTTPException(status_code=400, detail="Insufficient funds"))
+            else:
+                change = amount if kind == "deposit" else -amount
+                balances[account_id] += change
+                deltas[account_id] = deltas.get(account_id, 0) + change
+                results.append(BankAccount(id=account_id, balance=balances[account_id]))
+
+        changed = []
+        if deltas:
+            changed = await _apply_balance_deltas(session, deltas)
+            transfer_ids = iter(await _insert_transfers(session, records) if records else [])
+            # Ledger rows are written in operation order so running balances
+            # replay exactly as the operations were applied.
+            entries = []
+            for index, (operation, result) in enumerate(zip(operations, results)):
+                if isinstance(result, dict):
+                    results[index] = TransferHistory(id=next(transfer_ids), **result)
+                    entries.extend(_transfer_ledger_entries(results[index].id, **result))
+                elif isinstance(result, BankAccount):
+                    deposit = operation["kind"] == "deposit"
+                    entries.append({
+                        "account_id": result.id,
+                        "entry_type": "deposit" if deposit else "withdrawal",
+                        "amount": operation["amount"] if deposit else -operation["amount"],
+                    })
+            await session.execute(insert(LedgerEntry), entries)
+            await session.execute(insert(OutboxEvent), _outbox_rows(changed))
+            await _record_rollups(session, entries)
+    await account_cache.store(changed)
+    return results
+
+async def _lock_balances(session: AsyncSession, account_ids):
+    # Rows are locked in ascending id order, so two transactions over the
+    # same accounts queue behind each other instead of deadlocking.
+    statement = (
+        select(BankAccount.id, BankAccount.balance)
+        .where(BankAccount.id.in_(sorted(account_ids)))
+        .order_by(BankAccount.id)
+        .with_for_update(nowait=Config.TRANSACTION_LOCK_NOWAIT)
+    )
+    return {row.id: row.balance for row in (await session.execute(statement)).all()}
+
+def _transfer_error(from_account_id: int, to_account_id: int, amount: float, balances: dict = None):
+    """Why a transfer cannot be applied, as (status_code, detail), or None.
+
+    Without balances only the request itself is checked; with the locked
+    balances, the accounts and available funds are checked as well.
+    """
+    if from_account_id == to_account_id:
+        return status.HTTP_400_BAD_REQUEST, "Cannot transfer to the same account"
+    if amount <= 0:
+        return status.HTTP_400_BAD_REQUEST, "Transfer amount must be positive"
+    if balances is None:
+        return None
+    if from_account_id not in balances or to_account_id not in balances:
+        return status.HTTP_404_NOT_FOUND, "Account not found"
+    if balances[from_account_id] < amount:
+        return status.HTTP_400_BAD_REQUEST, "Insufficient funds"
+    return None
+
+def _move_funds(balances: dict, deltas: dict, from_account_id: int, to_account_id: int, amount: float):
+    balances[from_account_id] -= amount
+    balances[to_account_id] += amount
+    deltas[from_account_id] = deltas.get(from_account_id, 0) - amount
+    deltas[to_account_id] = deltas.get(to_account_id, 0) + amount
+
+async def _apply_balance_deltas(session: AsyncSession, deltas: dict):
+    result = await session.execute(
+        update(BankAccount)
+        .where(BankAccount.id.in_(list(deltas)))
+        .values(
+            balance=BankAccount.balance + case(deltas, value=BankAccount.id, else_=0),
+            version=BankAccount.version + 1,
+        )
+        .returning(*_account_columns)
+        .execution_options(synchronize_session=False)
+    )
+    return [row._asdict() for row in result.all()]
+
+async def _insert_transfers(session: AsyncSession, records: list):
+    inserted = await session.execute(
+        insert(TransferHistory).returning(TransferHistory.id, sort_by_parameter_order=True),
+        records,
+    )
+    return inserted.scalars().all()
+
+def _transfer_ledger_entries(transfer_id: int, from_account_id: int, to_account_id: int, amount: float):
+    return [
+        {"account_id": from_account_id, "entry_type": "transfer_out", "amount": -amount, "transfer_id": transfer_id},
+        {"account_id": to_account_id, "entry_type": "transfer_in", "amount": amount, "transfer_id": transfer_id},
+    ]
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func, or_
+from app.models import OutboxEvent
+from app.utils import logger
+from config.config import Config
+
+_event_columns = tuple(OutboxEvent.__table__.c)
+
+def event_payload(event):
+    return {
+        "id": event.id,
+        "account_id": event.account_id,
+        "type": event.event_type,
+        "balance": event.balance,
+        "version": event.version,
+        "timestamp": event.timestamp.isoformat() if event.timestamp is not None else None,
+    }
+
+def format_sse(event: dict):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+class EventDispatcher:
+    """Polls the outbox table and fans balance-change events out to subscribers.
+
+    Outbox ids are assigned before commit, so a lower id can become visible
+    after a higher one. Ids skipped over are re-checked until they show up
+    or OUTBOX_GAP_TIMEOUT_SECONDS pass, after which they are assumed to
+    belong to rolled-back transactions.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        poll_interval: float = Config.OUTBOX_POLL_INTERVAL_SECONDS,
+        batch_size: int = Config.OUTBOX_BATCH_SIZE,
+        queue_size: int = Config.EVENT_SUBSCRIBER_QUEUE_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.last_id = None
+        self.published = 0
+        self._gaps = {}
+        self._subscribers = {}
+        self._worker = None
+        self._pruner = None
+
+    @property
+    def running(self):
+        return self._worker is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._worker = asyncio.create_task(self._run())
+
+    def start_pruning(self, interval: float = Config.OUTBOX_PRUNE_INTERVAL_SECONDS):
+        """Deletes expired outbox rows every interval, whether or not anyone is subscribed."""
+        if self._pruner is None:
+            self._pruner = asyncio.create_task(self._prune_periodically(interval))
+
+    async def stop(self):
+        tasks = [task for task in (self._worker, self._pruner) if task is not None]
+        self._worker = self._pruner = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def subscribe(self, account_id: int):
+        self.start()
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(account_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, account_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(account_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[account_id]
+
+    def subscriber_count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def replay(self, account_id: int, after_id: int, limit: int = Config.OUTBOX_BATCH_SIZE):
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(*_event_columns)
+                .where(OutboxEvent.account_id == account_id, OutboxEvent.id > after_id)
+                .order_by(OutboxEvent.id)
+                .limit(limit)
+            )
+            return [event_payload(event) for event in result.all()]
+
+    def publish(self, events: list):
+        for event in events:
+            for queue in list(self._subscribers.get(event["account_id"], ())):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # A subscriber this far behind is closed; the client
+                    # reconnects with Last-Event-ID and replays from the table.
+                    self._close(event["account_id"], queue)
+        self.published += len(events)
+
+    def close_subscribers(self):
+        """Ends every open stream, e.g. on shutdown; clients reconnect with Last-Event-ID."""
+        for account_id, queues in list(self._subscribers.items()):
+            for queue in list(queues):
+                self._close(account_id, queue)
+
+    def _close(self, account_id: int, queue: asyncio.Queue):
+        self.unsubscribe(account_id, queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def poll(self, session):
+        """Reads the next batch of outbox events and publishes them; returns how many were read."""
+        if self.last_id is None:
+            self.last_id = (await session.execute(select(func.coalesce(func.max(OutboxEvent.id), 0)))).scalar_one()
+            await session.rollback()
+            return 0
+
+        now = time.monotonic()
+        self._gaps = {event_id: seen for event_id, seen in self._gaps.items() if now - seen < Config.OUTBOX_GAP_TIMEOUT_SECONDS}
+        condition = OutboxEvent.id > self.last_id
+        if self._gaps:
+            condition = or_(condition, OutboxEvent.id.in_(list(self._gaps)))
+        result = await session.execute(
+            select(*_event_columns).where(condition).order_by(OutboxEvent.id).limit(self.batch_size)
+        )
+        events = result.all()
+        await session.rollback()
+
+        for event in events:
+            # Changes to one account are serialized by its row lock, so a late
+            # gap event is older than anything already sent for that account
+            # and subscribers drop it by id.
+            if event.id in self._gaps:
+                del self._gaps[event.id]
+                continue
+            if event.id - self.last_id <= self.batch_size:
+                for missing in range(self.last_id + 1, event.id):
+                    self._gaps[missing] = now
+            self.last_id = event.id
+        self.publish([event_payload(event) for event in events])
+        return len(events)
+
+    async def prune(self, session, retention_seconds: int = Config.OUTBOX_RETENTION_SECONDS):
+        cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+        async with session.begin():
+            result = await session.execute(delete(OutboxEvent).where(OutboxEvent.timestamp < cutoff))
+        return result.rowcount
+
+    async def _run(self):
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    read = await self.poll(session)
+            except Exception as e:
+                logger.error("[Events] Outbox poll failed: %s", e)
+                read = 0
+            if read < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _prune_periodically(self, interval: float):
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    pruned = await self.prune(session)
+                if pruned:
+                    logger.info("[Events] Pruned %s expired outbox events", pruned)
+            except Exception as e:
+                logger.error("[Events] Outbox prune failed: %s", e)
+            await asyncio.sleep(interval)
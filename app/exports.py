@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from db.database import SessionLocal, ReadSessionLocal
+from app.crud import stream_statement_entries, stream_transfer_rows
+from app.utils import logger
+from config.config import Config
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_FIELDS = ("account_id", "entry_id", "timestamp", "entry_type", "amount", "running_balance", "transfer_id")
+TRANSFER_FIELDS = ("transfer_id", "timestamp", "from_account_id", "to_account_id", "amount")
+
+def _export_record(row):
+    return {
+        "account_id": row["account_id"],
+        "entry_id": row["id"],
+        "timestamp": row["timestamp"].isoformat(),
+        "entry_type": row["entry_type"],
+        "amount": row["amount"],
+        "running_balance": row["running_balance"],
+        "transfer_id": row["transfer_id"],
+    }
+
+def _transfer_record(row):
+    return {
+        "transfer_id": row["id"],
+        "timestamp": row["timestamp"].isoformat(),
+        "from_account_id": row["from_account_id"],
+        "to_account_id": row["to_account_id"],
+        "amount": row["amount"],
+    }
+
+# Ledger entries are never archived; transfers also come from the
+# transfer_history archive files once their partitions are dropped.
+EXPORT_SOURCES = {
+    "ledger": (stream_statement_entries, EXPORT_FIELDS, _export_record),
+    "transfers": (stream_transfer_rows, TRANSFER_FIELDS, _transfer_record),
+}
+
+async def export_statements(session, export_format: str = "csv", chunk_rows: int = 500, source: str = "ledger", **filters):
+    """Yields the statement export as text chunks of up to chunk_rows entries."""
+    stream_rows, fields, to_record = EXPORT_SOURCES[source]
+    buffer = io.StringIO()
+    writer = None
+    if export_format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+    rows = 0
+    async for row in stream_rows(session, **filters):
+        record = to_record(row)
+        if writer is not None:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record) + "\n")
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+async def export_shard(session_factory, path: str, shard: int, shards: int, export_format: str = "csv", source: str = "ledger", **filters):
+    """Writes one shard of accounts to a gzip file; compression runs off the event loop."""
+    rows = 0
+    with gzip.open(path, "wt", newline="") as output:
+        async with session_factory() as session:
+            async for chunk in export_statements(session, export_format, source=source, shard=shard, shards=shards, **filters):
+                await asyncio.to_thread(output.write, chunk)
+                rows += chunk.count("\n")
+    if export_format == "csv":
+        rows -= 1
+    logger.info("[Export] Wrote shard %s/%s to %s (%s entries)", shard, shards, path, rows)
+    return {"shard": shard, "path": path, "entries": rows}
+
+async def export_shards(session_factory, directory: str, shards: int, export_format: str = "csv", parallelism: int = Config.STATEMENT_EXPORT_PARALLELISM, source: str = "ledger", **filters):
+    """Exports accounts split by account_id % shards into one compressed file per shard."""
+    os.makedirs(directory, exist_ok=True)
+    semaphore = asyncio.Semaphore(parallelism)
+    prefix = "statements" if source == "ledger" else source
+
+    async def run(shard):
+        path = os.path.join(directory, f"{prefix}-{shard:04d}-of-{shards:04d}.{export_format}.gz")
+        async with semaphore:
+            return await export_shard(session_factory, path, shard, shards, export_format, source, **filters)
+
+    return await asyncio.gather(*(run(shard) for shard in range(shards)))
+
+async def run_export(args):
+    session_factory = ReadSessionLocal or SessionLocal
+    filters = {
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "account_ids": [int(account_id) for account_id in args.accounts.split(",")] if args.accounts else None,
+    }
+    if args.output_dir is None:
+        async with session_factory() as session:
+            async for chunk in export_statements(session, args.format, source=args.source, **filters):
+                sys.stdout.write(chunk)
+        return
+    results = await export_shards(session_factory, args.output_dir, args.shards, args.format, args.parallelism, args.source, **filters)
+    logger.info("[Export] Exported %s entries in %s files", sum(result["entries"] for result in results), len(results))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export account statements for a date range as CSV or NDJSON.")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, help="inclusive, ISO 8601")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, help="exclusive, ISO 8601")
+    parser.add_argument("--accounts", help="comma-separated account ids (default: all accounts)")
+    parser.add_argument("--format", choices=tuple(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--source", choices=tuple(EXPORT_SOURCES), default="ledger", help="ledger entries with running balances, or transfers including archived months")
+    parser.add_argument("--output-dir", help="write one gzip file per shard here instead of streaming to stdout")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--parallelism", type=int, default=Config.STATEMENT_EXPORT_PARALLELISM)
+    args = parser.parse_args()
+    asyncio.run(run_export(args))
+
+if __name__ == "__main__":
+    main()
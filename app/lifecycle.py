@@ -0,0 +1,115 @@
+import asyncio
+import signal
+import threading
+import time
+from fastapi import HTTPException
+from sqlalchemy import text
+from app.crud import get_account_details, get_transfer_history, get_account_statements, deposit_funds, withdraw_funds, transfer
+from app.partitions import ensure_default_partition
+from app.utils import logger
+from config.config import Config
+
+# No account has a negative id, so these run every hot statement end to end
+# without locking or writing anything.
+WARMUP_ACCOUNT_ID = -1
+
+READ_STATEMENTS = (
+    lambda session: get_account_details(session, WARMUP_ACCOUNT_ID),
+    lambda session: get_transfer_history(session, WARMUP_ACCOUNT_ID),
+    lambda session: get_account_statements(session, WARMUP_ACCOUNT_ID),
+)
+WRITE_STATEMENTS = (
+    lambda session: deposit_funds(session, WARMUP_ACCOUNT_ID, 1.0),
+    lambda session: withdraw_funds(session, WARMUP_ACCOUNT_ID, 1.0),
+    lambda session: transfer(session, WARMUP_ACCOUNT_ID, WARMUP_ACCOUNT_ID - 1, 1.0),
+)
+
+async def warm_connection(session, statements=READ_STATEMENTS + WRITE_STATEMENTS):
+    """Opens the session's connection and prepares the hot request statements on it."""
+    await session.connection()
+    for run in statements:
+        try:
+            await run(session)
+        except HTTPException:
+            pass
+        await session.rollback()
+
+async def warm_pool(session_factory, engine, connections: int = Config.DB_WARM_CONNECTIONS, statements=READ_STATEMENTS + WRITE_STATEMENTS):
+    """Warms up to `connections` pooled connections at once; returns how many were warmed.
+
+    The sessions are held open together so each one checks out a different
+    connection, and no more than the pool keeps are opened.
+    """
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "size"):
+        connections = min(connections, pool.size())
+    else:
+        connections = min(connections, 1)
+
+    async def warm():
+        async with session_factory() as session:
+            await warm_connection(session, statements)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(warm() for _ in range(connections)), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    for failure in failures[:1]:
+        logger.warning("[Lifecycle] Could not warm %s of %s connections: %s", len(failures), connections, failure)
+    warmed = connections - len(failures)
+    logger.info("[Lifecycle] Warmed %s connections in %.3fs", warmed, time.perf_counter() - start)
+    return warmed
+
+async def check_database(session_factory, timeout: float = Config.DB_HEALTH_CHECK_TIMEOUT):
+    try:
+        async with session_factory() as session:
+            await asyncio.wait_for(session.execute(text("SELECT 1")), timeout)
+        return True
+    except Exception as e:
+        logger.warning("[Lifecycle] Database health check failed: %s", e)
+        return False
+
+async def prepare_partitions(session_factory):
+    """Makes sure transfers have a partition to land in before the maintenance job first runs."""
+    try:
+        async with session_factory() as session:
+            await ensure_default_partition(session)
+    except Exception as e:
+        logger.warning("[Lifecycle] Could not create the default transfer_history partition: %s", e)
+
+async def drain_pool(engine, timeout: float = Config.SHUTDOWN_DRAIN_SECONDS, poll_interval: float = 0.1):
+    """Waits for checked-out connections to come back, then closes the pool."""
+    pool = engine.sync_engine.pool
+    deadline = time.monotonic() + timeout
+    while hasattr(pool, "checkedout") and pool.checkedout() and time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+    if hasattr(pool, "checkedout") and pool.checkedout():
+        logger.warning("[Lifecycle] Closing pool with %s connections still checked out", pool.checkedout())
+    await engine.dispose()
+
+def on_shutdown_signal(callback, signals=(signal.SIGINT, signal.SIGTERM)):
+    """Also schedules callback on the running loop when the server is told to stop.
+
+    uvicorn runs the lifespan shutdown only after open connections finish, so
+    long-lived streams have to be ended as soon as the signal arrives. The
+    server's own handlers still run afterwards.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for signum in signals:
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+
+        def handler(received, frame, previous=previous):
+            loop.call_soon_threadsafe(callback)
+            previous(received, frame)
+
+        signal.signal(signum, handler)
+
+class Readiness:
+    def __init__(self):
+        self.warmed = False
+        self.draining = False
+
+readiness = Readiness()
@@ -0,0 +1,97 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+from app.metrics import requests_rejected
+
+class ConcurrencyLimiter:
+    """Caps how many requests run a guarded section (database work, password hashing) at once.
+
+    Requests beyond the limit wait up to queue_timeout for a slot, and at most
+    max_waiting of them wait at all; the rest are rejected with 503 right away
+    instead of timing out on the resource behind the limiter.
+    """
+
+    def __init__(self, limit: int, max_waiting: int, queue_timeout: float, retry_after: int = 1, reason: str = "busy"):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.reason = reason
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max(limit, 1))
+
+    def _reject(self):
+        requests_rejected.inc(self.reason)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.limit <= 0:
+            yield
+            return
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self._reject()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+class RateLimiter:
+    """Token bucket per key: `rate` requests per second with bursts up to `burst`.
+
+    A rate of 0 disables the limiter. Buckets are kept in LRU order and the
+    least recently seen keys are dropped beyond max_keys; a dropped key simply
+    starts again with a full bucket.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = 100000):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def acquire(self, key: str, now: float = None):
+        """Takes one token for key; returns 0 if allowed, else seconds until a token is available."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def check(self, key: str):
+        wait = self.acquire(key)
+        if wait:
+            requests_rejected.inc(f"rate_limited_{self.name}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
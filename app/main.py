@@ -1,13 +1,117 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from db.database import get_db
-from app.crud import create_bank_account, transfer, get_balance, get_transfer_history, create_customer, check_customer_exists, deposit_funds, withdraw_funds, get_account_details, list_customer_accounts, get_account_statements
-from app.auth import get_current_user, create_access_token, Token
-from pydantic import BaseModel
-from app.utils import logger
+from starlette.routing import Match
+from db.database import get_db, get_read_db, SessionLocal, ReadSessionLocal, engine, read_engine, replica_router, read_client_key, engines
+from app.crud import TransactionConflict, create_bank_account, transfer, transfer_batch, get_balance, get_transfer_history, create_customer, create_customers_bulk, create_bank_accounts_bulk, check_customer_exists, get_balance_as_of, deposit_funds, withdraw_funds, get_account_details, get_accounts, get_customer_portfolio, list_customer_accounts, get_account_statements, get_account_summary, get_customer_summary
+from app.auth import get_current_user, create_access_token, authenticate_user, Token, token_cache, failed_login_cache
+from app.cache import account_cache
+from app.limits import ConcurrencyLimiter, RateLimiter
+from app.metrics import registry, Gauge, MetricsMiddleware, transfer_outcomes, register_pool_gauges, register_cache_gauges
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Literal
+from datetime import datetime, date
+from app.utils import logger, encode_cursor, decode_cursor, request_id_var, log_sampled_var, new_request_id, RouteSampler
+from app.sequencer import AccountSequencer
+from app.exports import export_statements, EXPORT_FORMATS
+from app.events import EventDispatcher, format_sse
+from app.profiling import ProfilingMiddleware
+from app.lifecycle import warm_pool, drain_pool, check_database, prepare_partitions, on_shutdown_signal, readiness, READ_STATEMENTS
+from config.config import Config
 
-app = FastAPI()
+sequencer = AccountSequencer(SessionLocal)
+event_dispatcher = EventDispatcher(SessionLocal)
+db_admission = ConcurrencyLimiter(
+    Config.DB_ADMISSION_LIMIT, Config.DB_ADMISSION_MAX_WAITING,
+    Config.DB_ADMISSION_QUEUE_TIMEOUT, Config.DB_ADMISSION_RETRY_AFTER_SECONDS
+)
+read_rate_limiter = RateLimiter("read", Config.RATE_LIMIT_READ_PER_SECOND, Config.RATE_LIMIT_READ_BURST, Config.RATE_LIMIT_MAX_SUBJECTS)
+write_rate_limiter = RateLimiter("write", Config.RATE_LIMIT_WRITE_PER_SECOND, Config.RATE_LIMIT_WRITE_BURST, Config.RATE_LIMIT_MAX_SUBJECTS)
+
+async def db_slot():
+    async with db_admission.slot():
+        yield
+
+def rate_limited_user(limiter: RateLimiter, admission: ConcurrencyLimiter = None):
+    """Authenticates, charges the subject's bucket, then waits for a database slot if admission is given.
+
+    Streaming routes pass no admission: their slot would be held until the
+    stream ends.
+    """
+    async def dependency(current_user=Depends(get_current_user)):
+        limiter.check(current_user.username)
+        if admission is None:
+            yield current_user
+            return
+        async with admission.slot():
+            yield current_user
+    return dependency
+
+read_user = rate_limited_user(read_rate_limiter, db_admission)
+write_user = rate_limited_user(write_rate_limiter, db_admission)
+stream_user = rate_limited_user(read_rate_limiter)
+
+def end_event_streams():
+    readiness.draining = True
+    event_dispatcher.close_subscribers()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if Config.TRANSFER_HISTORY_PARTITIONED:
+        await prepare_partitions(SessionLocal)
+    await warm_pool(SessionLocal, engine)
+    if ReadSessionLocal is not None:
+        await warm_pool(ReadSessionLocal, read_engine, statements=READ_STATEMENTS)
+    event_dispatcher.start_pruning()
+    readiness.warmed = True
+    on_shutdown_signal(end_event_streams)
+    yield
+    end_event_streams()
+    await event_dispatcher.stop()
+    await sequencer.stop()
+    await asyncio.gather(*(drain_pool(pool_engine) for pool_engine in engines.values()))
+    logger.info("[Lifecycle] Shutdown complete")
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+register_pool_gauges(engines)
+register_cache_gauges({"token": token_cache, "login_failure": failed_login_cache, "account": account_cache})
+registry.register(Gauge(
+    "event_subscribers", "Open account event streams.", lambda: [((), event_dispatcher.subscriber_count())]
+))
+registry.register(Gauge(
+    "db_admission_requests", "Requests holding or waiting for a database slot.",
+    lambda: [(("in_flight",), db_admission.in_flight), (("waiting",), db_admission.waiting)], ("state",)
+))
+log_sampler = RouteSampler()
+
+def route_path(request: Request):
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return request.url.path
+
+@app.middleware("http")
+async def request_logging_context(request: Request, call_next):
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    request_id_var.set(request_id)
+    path = route_path(request) if log_sampler.rates else request.url.path
+    log_sampled_var.set(log_sampler.sample(request.method, path))
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def track_writes_for_replica_reads(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD") and response.status_code < 400:
+        replica_router.note_write(read_client_key(request))
+    return response
 
 class AccountCreate(BaseModel):
     customer_id: int
@@ -21,52 +125,270 @@ class TransferAmount(BaseModel):
     to_account_id: int
     amount: float
 
+class TransferBatch(BaseModel):
+    transfers: List[TransferAmount]
+    atomic: bool = True
+
+class CustomerBulkCreate(BaseModel):
+    customers: List[CustomerCreate] = Field(min_length=1, max_length=Config.BULK_MAX_ITEMS)
+
+class AccountBulkCreate(BaseModel):
+    accounts: List[AccountCreate] = Field(min_length=1, max_length=Config.BULK_MAX_ITEMS)
+
+class CustomerCreated(BaseModel):
+    customer_id: int
+
+class CustomersBulkCreated(BaseModel):
+    customer_ids: List[int]
+
+class AccountCreated(BaseModel):
+    account_id: int
+    balance: float
+
+class AccountBulkItem(BaseModel):
+    index: int
+    status: str
+    account_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class AccountsBulkCreated(BaseModel):
+    created: int
+    failed: int
+    results: List[AccountBulkItem]
+
+class TransferResult(BaseModel):
+    from_account_id: int
+    to_account_id: int
+    amount: float
+
+class TransferBatchItem(BaseModel):
+    index: int
+    status: str
+    transfer_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class TransferBatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[TransferBatchItem]
+
+class BalanceResponse(BaseModel):
+    balance: float
+    as_of: Optional[datetime] = None
+
+class BalanceChange(BaseModel):
+    account_id: int
+    new_balance: float
+
+class AccountDetails(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    customer_id: Optional[int] = None
+    balance: float
+
+class TransferRecord(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    from_account_id: int
+    to_account_id: int
+    amount: float
+    timestamp: Optional[datetime] = None
+
+class AccountsLookup(BaseModel):
+    accounts: List[AccountDetails]
+    missing: List[int]
+
+class PortfolioAccount(AccountDetails):
+    recent_transfers: List[TransferRecord]
+
+class CustomerPortfolio(BaseModel):
+    customer_id: int
+    total_balance: float
+    accounts: List[PortfolioAccount]
+
+class TransferHistoryPage(BaseModel):
+    transfer_history: List[TransferRecord]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+class LedgerRecord(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    account_id: int
+    entry_type: str
+    amount: float
+    transfer_id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    running_balance: Optional[float] = None
+
+class SummaryCounts(BaseModel):
+    inflow: float
+    outflow: float
+    transfers_in: int
+    transfers_out: int
+    deposits: int
+    withdrawals: int
+
+class SummaryTotals(SummaryCounts):
+    net: float
+
+class DailySummary(SummaryCounts):
+    day: date
+
+class AccountSummary(BaseModel):
+    account_id: int
+    totals: SummaryTotals
+    days: List[DailySummary]
+
+class CustomerAccountSummary(BaseModel):
+    account_id: int
+    totals: SummaryTotals
+
+class CustomerSummary(BaseModel):
+    customer_id: int
+    totals: SummaryTotals
+    accounts: List[CustomerAccountSummary]
+
+class HealthStatus(BaseModel):
+    status: str
+
+class StatementPage(BaseModel):
+    account_id: int
+    statement: List[LedgerRecord]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+class SummaryRange:
+    def __init__(
+        self,
+        start_day: Optional[date] = Query(None, alias="from"),
+        end_day: Optional[date] = Query(None, alias="to"),
+    ):
+        if start_day is not None and end_day is not None and end_day < start_day:
+            raise HTTPException(status_code=400, detail="to must not be before from")
+        self.start_day = start_day
+        self.end_day = end_day
+
+class HistoryPage:
+    def __init__(
+        self,
+        limit: int = Query(100, ge=1, le=1000),
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+    ):
+        if before is not None and after is not None:
+            raise HTTPException(status_code=400, detail="Use either before or after, not both")
+        try:
+            self.before = decode_cursor(before) if before is not None else None
+            self.after = decode_cursor(after) if after is not None else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        self.limit = limit
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def filters(self):
+        return {
+            "limit": self.limit,
+            "before": self.before,
+            "after": self.after,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+        }
+
+    def cursors(self, rows):
+        full = len(rows) == self.limit
+        older = rows and (full or self.after is not None)
+        newer = rows and (self.before is not None or (self.after is not None and full))
+        return {
+            "next_cursor": encode_cursor(rows[-1].timestamp, rows[-1].id) if older else None,
+            "prev_cursor": encode_cursor(rows[0].timestamp, rows[0].id) if newer else None,
+        }
+
+def transfer_outcome(error: Exception):
+    if isinstance(error, TransactionConflict):
+        return "conflict"
+    if isinstance(error, HTTPException):
+        if error.status_code == 404:
+            return "not_found"
+        if error.detail == "Insufficient funds":
+            return "insufficient_funds"
+    return "error"
+
+@app.get("/health/live", response_model=HealthStatus)
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready", response_model=HealthStatus)
+async def readiness_check(response: Response):
+    if readiness.draining:
+        status = "draining"
+    elif not readiness.warmed:
+        status = "starting"
+    elif not await check_database(SessionLocal):
+        status = "database unavailable"
+    else:
+        return {"status": "ok"}
+    response.status_code = 503
+    return {"status": status}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
     request: Request, 
-    form_data: OAuth2PasswordRequestForm = Depends()
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        logger.info(f"[Token] Login attempt for username={form_data.username}")
-        user_in_db = {"username": "user", "hashed_password": "fakehashedpassword"}
-        if not user_in_db or not user_in_db["hashed_password"] == "fakehashed" + form_data.password:
-            logger.warning(f"[Token] Invalid login attempt for username={form_data.username}")
+        logger.info("[Token] Login attempt for username=%s", form_data.username)
+        user = await authenticate_user(db, form_data.username, form_data.password)
+        if user is None:
+            logger.warning("[Token] Invalid login attempt for username=%s", form_data.username)
             raise HTTPException(
                 status_code=401,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        logger.info(f" Testing username={form_data.username} {user_in_db["username"]}")
-        access_token = create_access_token(data={"sub": user_in_db["username"]})
-        logger.info(f"[Token] Access token created for username={form_data.username}")
+        access_token = create_access_token(data={"sub": user.username})
+        logger.info("[Token] Access token created for username=%s", form_data.username)
         return {"access_token": access_token, "token_type": "bearer"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Token] Error generating token for username={form_data.username}: {e}")
+        logger.error("[Token] Error generating token for username=%s: %s", form_data.username, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/customers/")
+@app.post("/customers/", response_model=CustomerCreated, dependencies=[Depends(db_slot)])
 async def create_customer_endpoint(
     customer: CustomerCreate, 
     db: AsyncSession = Depends(get_db)
 ):
     try:
-        logger.info(f"[Create Customer] Creating new customer with name={customer.name}")
+        logger.info("[Create Customer] Creating new customer with name=%s", customer.name)
         new_customer = await create_customer(db, customer.name)
-        logger.info(f"[Create Customer] Created customer with id={new_customer.id}")
+        logger.info("[Create Customer] Created customer with id=%s", new_customer.id)
         return {"customer_id": new_customer.id}
     except Exception as e:
-        logger.error(f"[Create Customer] Error creating customer: {e}")
+        logger.error("[Create Customer] Error creating customer: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/accounts/")
+@app.post("/accounts/", response_model=AccountCreated)
 async def create_new_account(
     request: Request,
     account: AccountCreate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(write_user)
 ):
     try:
-        logger.info(f"[Create Account] Attempt to create account with customer_id={account.customer_id}")
+        logger.info("[Create Account] Attempt to create account with customer_id=%s", account.customer_id)
         customer = await check_customer_exists(db, account.customer_id)
         
         if customer is None:
@@ -74,132 +396,373 @@ async def create_new_account(
             raise HTTPException(status_code=404, detail="Customer does not exist")
 
         created_account = await create_bank_account(db, account.customer_id, account.initial_deposit)
-        logger.info(f"[Create Account] Account created with account_id={created_account.id}")
+        logger.info("[Create Account] Account created with account_id=%s", created_account.id)
         return {"account_id": created_account.id, "balance": created_account.balance}
     except Exception as e:
-        logger.error(f"[Create Account] Error creating account for customer_id={account.customer_id}: {e}")
+        logger.error("[Create Account] Error creating account for customer_id=%s: %s", account.customer_id, e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.post("/customers/bulk", response_model=CustomersBulkCreated)
+async def create_customers_bulk_endpoint(
+    batch: CustomerBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(write_user)
+):
+    try:
+        logger.info("[Create Customers] Creating %s customers", len(batch.customers))
+        customer_ids = await create_customers_bulk(db, [customer.name for customer in batch.customers])
+        logger.info("[Create Customers] Created %s customers", len(customer_ids))
+        return {"customer_ids": customer_ids}
+    except Exception as e:
+        logger.error("[Create Customers] Error creating customers: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/transfer/")
+@app.post("/accounts/bulk", response_model=AccountsBulkCreated, response_model_exclude_none=True)
+async def create_accounts_bulk_endpoint(
+    batch: AccountBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(write_user)
+):
+    try:
+        logger.info("[Create Accounts] Creating %s accounts", len(batch.accounts))
+        results = await create_bank_accounts_bulk(db, [account.model_dump() for account in batch.accounts])
+        created = sum(1 for result in results if result["status"] == "ok")
+        logger.info("[Create Accounts] Created %s of %s accounts", created, len(results))
+        return {"created": created, "failed": len(results) - created, "results": results}
+    except Exception as e:
+        logger.error("[Create Accounts] Error creating accounts: %s", e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.post("/transfer/", response_model=TransferResult)
 async def perform_transfer(
     request: Request,
     transferinfo: TransferAmount,
     db: AsyncSession = Depends(get_db), 
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(write_user)
 ):
     try:
-        logger.info(f"[Transfer] Attempting transfer: amount={transferinfo.amount} from account {transferinfo.from_account_id} to account {transferinfo.to_account_id}")
-        record = await transfer(db, transferinfo.from_account_id, transferinfo.to_account_id, transferinfo.amount)
-        logger.info(f"[Transfer] Transfer successful: amount={record.amount} from account {record.from_account_id} to account {record.to_account_id}")
+        logger.info("[Transfer] Attempting transfer: amount=%s from account %s to account %s", transferinfo.amount, transferinfo.from_account_id, transferinfo.to_account_id)
+        if Config.SEQUENCER_ENABLED:
+            record = await sequencer.transfer(transferinfo.from_account_id, transferinfo.to_account_id, transferinfo.amount)
+        else:
+            record = await transfer(db, transferinfo.from_account_id, transferinfo.to_account_id, transferinfo.amount)
+        logger.info("[Transfer] Transfer successful: amount=%s from account %s to account %s", record.amount, record.from_account_id, record.to_account_id)
+        transfer_outcomes.inc("success")
         return {"from_account_id": record.from_account_id, "to_account_id": record.to_account_id, "amount": record.amount}
+    except TransactionConflict as e:
+        transfer_outcomes.inc(transfer_outcome(e))
+        logger.warning("[Transfer] Gave up on transfer from account %s to %s after repeated %s", transferinfo.from_account_id, transferinfo.to_account_id, e.reason)
+        raise
+    except HTTPException as e:
+        transfer_outcomes.inc(transfer_outcome(e))
+        logger.warning("[Transfer] Transfer from account %s to %s rejected: %s", transferinfo.from_account_id, transferinfo.to_account_id, e.detail)
+        raise
     except Exception as e:
-        logger.error(f"[Transfer] Error during transfer from account {transferinfo.from_account_id} to {transferinfo.to_account_id}: {e}")
+        transfer_outcomes.inc(transfer_outcome(e))
+        logger.error("[Transfer] Error during transfer from account %s to %s: %s", transferinfo.from_account_id, transferinfo.to_account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.get("/accounts/{account_id}/balance")
+@app.post("/transfer/batch", response_model=TransferBatchResult, response_model_exclude_none=True)
+async def perform_transfer_batch(
+    request: Request,
+    batch: TransferBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(write_user)
+):
+    try:
+        logger.info("[Transfer Batch] Attempting %s transfers atomic=%s", len(batch.transfers), batch.atomic)
+        results = await transfer_batch(db, [item.model_dump() for item in batch.transfers], atomic=batch.atomic)
+        succeeded = sum(1 for result in results if result["status"] == "ok")
+        logger.info("[Transfer Batch] Settled %s of %s transfers", succeeded, len(results))
+        return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+    except HTTPException as e:
+        logger.warning("[Transfer Batch] Batch rejected: %s", e.detail)
+        raise
+    except Exception as e:
+        logger.error("[Transfer Batch] Error during batch transfer: %s", e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/accounts/{account_id}/balance", response_model=BalanceResponse, response_model_exclude_none=True)
 async def read_balance(
     account_id: int, 
-    db: AsyncSession = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    as_of: Optional[datetime] = None,
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"[Get Balance] Fetching balance for account_id={account_id}")
+        if as_of is not None:
+            logger.info("[Get Balance] Fetching balance for account_id=%s as of %s", account_id, as_of)
+            balance = await get_balance_as_of(db, account_id, as_of)
+            logger.info("[Get Balance] Balance for account_id=%s as of %s is %s", account_id, as_of, balance)
+            return {"balance": balance, "as_of": as_of}
+        logger.info("[Get Balance] Fetching balance for account_id=%s", account_id)
         balance = await get_balance(db, account_id)
-        logger.info(f"[Get Balance] Balance for account_id={account_id} is {balance}")
+        logger.info("[Get Balance] Balance for account_id=%s is %s", account_id, balance)
         return {"balance": balance}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Get Balance] Error fetching balance for account_id={account_id}: {e}")
+        logger.error("[Get Balance] Error fetching balance for account_id=%s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
 
-@app.get("/accounts/{account_id}/history")
+@app.get("/accounts/{account_id}/history", response_model=TransferHistoryPage)
 async def read_transfer_history(
     account_id: int, 
-    db: AsyncSession = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    page: HistoryPage = Depends(),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"[Get History] Fetching transfer history for account_id={account_id}")
-        history = await get_transfer_history(db, account_id)
-        logger.info(f"[Get History] Transfer history for account_id={account_id}: {history}")
-        return {"transfer_history": history}
+        logger.info("[Get History] Fetching transfer history for account_id=%s", account_id)
+        history = await get_transfer_history(db, account_id, **page.filters())
+        logger.info("[Get History] Returned %s transfers for account_id=%s", len(history), account_id)
+        return {"transfer_history": history, **page.cursors(history)}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Get History] Error fetching transfer history for account_id={account_id}: {e}")
+        logger.error("[Get History] Error fetching transfer history for account_id=%s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
 
-@app.post("/accounts/{account_id}/deposit")
+@app.post("/accounts/{account_id}/deposit", response_model=BalanceChange)
 async def deposit_to_account(
     account_id: int, 
     amount: dict, 
     db: AsyncSession = Depends(get_db), 
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(write_user)
 ):
     try:
-        logger.info(f"[Deposit] Depositing {amount['amount']} to account_id={account_id}")
-        account = await deposit_funds(db, account_id, amount['amount'])
-        logger.info(f"[Deposit] New balance for account_id={account_id} is {account.balance}")
+        logger.info("[Deposit] Depositing %s to account_id=%s", amount['amount'], account_id)
+        if Config.SEQUENCER_ENABLED:
+            account = await sequencer.deposit(account_id, amount['amount'])
+        else:
+            account = await deposit_funds(db, account_id, amount['amount'])
+        logger.info("[Deposit] New balance for account_id=%s is %s", account_id, account.balance)
         return {"account_id": account.id, "new_balance": account.balance}
+    except TransactionConflict as e:
+        logger.warning("[Deposit] Gave up on deposit to account %s after repeated %s", account_id, e.reason)
+        raise
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Deposit] Error depositing to account {account_id}: {e}")
+        logger.error("[Deposit] Error depositing to account %s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/accounts/{account_id}/withdraw")
+@app.post("/accounts/{account_id}/withdraw", response_model=BalanceChange)
 async def withdraw_from_account(
     account_id: int, 
     amount: dict, 
     db: AsyncSession = Depends(get_db), 
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(write_user)
 ):
     try:
-        logger.info(f"[Withdrawal] Withdrawing {amount['amount']} from account_id={account_id}")
-        account = await withdraw_funds(db, account_id, amount['amount'])
-        logger.info(f"[Withdrawal] New balance for account_id={account_id} is {account.balance}")
+        logger.info("[Withdrawal] Withdrawing %s from account_id=%s", amount['amount'], account_id)
+        if Config.SEQUENCER_ENABLED:
+            account = await sequencer.withdraw(account_id, amount['amount'])
+        else:
+            account = await withdraw_funds(db, account_id, amount['amount'])
+        logger.info("[Withdrawal] New balance for account_id=%s is %s", account_id, account.balance)
         return {"account_id": account.id, "new_balance": account.balance}
+    except TransactionConflict as e:
+        logger.warning("[Withdrawal] Gave up on withdrawal from account %s after repeated %s", account_id, e.reason)
+        raise
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Withdrawal] Error withdrawing from account {account_id}: {e}")
+        logger.error("[Withdrawal] Error withdrawing from account %s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.get("/accounts/{account_id}")
+def parse_account_ids(values: List[str]):
+    """Accepts repeated and comma-separated ids: ?ids=1,2&ids=3."""
+    try:
+        account_ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if not account_ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(account_ids) > Config.ACCOUNT_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {Config.ACCOUNT_LOOKUP_MAX_IDS} ids per request")
+    return account_ids
+
+@app.get("/accounts", response_model=AccountsLookup)
+async def get_accounts_information(
+    ids: List[str] = Query(...),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    account_ids = parse_account_ids(ids)
+    try:
+        logger.info("[Get Accounts] Retrieving %s accounts", len(account_ids))
+        return await get_accounts(db, account_ids)
+    except Exception as e:
+        logger.error("[Get Accounts] Error retrieving accounts %s: %s", account_ids, e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/accounts/{account_id}", response_model=AccountDetails)
 async def get_account_information(
     account_id: int, 
-    db: AsyncSession = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"[Get Account] Retrieving information for account_id={account_id}")
+        logger.info("[Get Account] Retrieving information for account_id=%s", account_id)
         account = await get_account_details(db, account_id)
         return account
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Get Account] Error retrieving account {account_id}: {e}")
+        logger.error("[Get Account] Error retrieving account %s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.get("/customers/{customer_id}/accounts")
+@app.get("/customers/{customer_id}/accounts", response_model=List[AccountDetails])
 async def get_customer_accounts(
     customer_id: int, 
-    db: AsyncSession = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"[Get Customer Accounts] Listing accounts for customer_id={customer_id}")
+        logger.info("[Get Customer Accounts] Listing accounts for customer_id=%s", customer_id)
         accounts = await list_customer_accounts(db, customer_id)
         return accounts
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"[Get Customer Accounts] Error listing accounts for customer_id={customer_id}: {e}")
+        logger.error("[Get Customer Accounts] Error listing accounts for customer_id=%s: %s", customer_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
-@app.get("/accounts/{account_id}/statement")
+@app.get("/customers/{customer_id}/portfolio", response_model=CustomerPortfolio)
+async def get_customer_portfolio_endpoint(
+    customer_id: int,
+    transfers: int = Query(Config.PORTFOLIO_RECENT_TRANSFERS, ge=0, le=Config.PORTFOLIO_MAX_RECENT_TRANSFERS),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        logger.info("[Portfolio] Building portfolio for customer_id=%s with %s transfers per account", customer_id, transfers)
+        return await get_customer_portfolio(db, customer_id, transfers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("[Portfolio] Error building portfolio for customer_id=%s: %s", customer_id, e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/accounts/{account_id}/summary", response_model=AccountSummary)
+async def read_account_summary(
+    account_id: int,
+    days: SummaryRange = Depends(),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        logger.info("Retrieving summary for account_id=%s from %s to %s", account_id, days.start_day, days.end_day)
+        return await get_account_summary(db, account_id, days.start_day, days.end_day)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error retrieving summary for account_id=%s: %s", account_id, e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/customers/{customer_id}/summary", response_model=CustomerSummary)
+async def read_customer_summary(
+    customer_id: int,
+    days: SummaryRange = Depends(),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        logger.info("Retrieving summary for customer_id=%s from %s to %s", customer_id, days.start_day, days.end_day)
+        return await get_customer_summary(db, customer_id, days.start_day, days.end_day)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error retrieving summary for customer_id=%s: %s", customer_id, e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@app.get("/accounts/{account_id}/statement", response_model=StatementPage)
 async def get_account_statement(
     account_id: int, 
-    db: AsyncSession = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    page: HistoryPage = Depends(),
+    current_user: str = Depends(read_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     try:
-        logger.info(f"Retrieving statement for account_id={account_id}")
-        statement = await get_account_statements(db, account_id)
-        logger.info(f"Statement retrieved for account_id={account_id}: {statement}")
-        return {"account_id": account_id, "statement": statement}
+        logger.info("Retrieving statement for account_id=%s", account_id)
+        statement = await get_account_statements(db, account_id, **page.filters())
+        logger.info("Statement retrieved for account_id=%s with %s entries", account_id, len(statement))
+        return {"account_id": account_id, "statement": statement, **page.cursors(statement)}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error retrieving statement for account_id={account_id}: {e}")
+        logger.error("Error retrieving statement for account_id=%s: %s", account_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    
\ No newline at end of file
+    
+
+@app.get("/statements/export")
+async def export_statement_entries(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    account_ids: Optional[List[int]] = Query(None),
+    format: Literal["csv", "ndjson"] = "csv",
+    source: Literal["ledger", "transfers"] = "ledger",
+    current_user: str = Depends(stream_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if start_date is not None and end_date is not None and end_date <= start_date:
+        raise HTTPException(status_code=400, detail="end_date must be after start_date")
+    logger.info("Exporting statements from %s to %s for %s accounts", start_date, end_date, len(account_ids) if account_ids else "all")
+
+    async def body():
+        try:
+            async for chunk in export_statements(db, format, source=source, start_date=start_date, end_date=end_date, account_ids=account_ids):
+                yield chunk
+        except Exception as e:
+            logger.error("Error exporting statements: %s", e)
+            raise
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{"statements" if source == "ledger" else source}.{format}"'},
+    )
+
+@app.get("/accounts/{account_id}/events")
+async def stream_account_events(
+    account_id: int,
+    last_event_id: Optional[int] = Header(None),
+    current_user: str = Depends(stream_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    await get_account_details(db, account_id)
+    # Release the connection now; the stream itself can stay open for hours.
+    await db.close()
+    logger.info("Streaming events for account_id=%s from last_event_id=%s", account_id, last_event_id)
+
+    async def body():
+        queue = event_dispatcher.subscribe(account_id)
+        last_sent = last_event_id
+        try:
+            if last_event_id is not None:
+                while True:
+                    missed = await event_dispatcher.replay(account_id, last_sent)
+                    for event in missed:
+                        yield format_sse(event)
+                        last_sent = event["id"]
+                    if len(missed) < event_dispatcher.batch_size:
+                        break
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=Config.EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                if last_sent is not None and event["id"] <= last_sent:
+                    continue
+                yield format_sse(event)
+                last_sent = event["id"]
+        finally:
+            event_dispatcher.unsubscribe(account_id, queue)
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
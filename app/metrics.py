@@ -0,0 +1,207 @@
+import time
+from bisect import bisect_left
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge:
+    """A metric whose values are read from a callback at scrape time."""
+
+    def __init__(self, name: str, documentation: str, callback, labelnames=(), metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")
+))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+))
+db_queries = registry.register(Counter(
+    "db_queries_total", "SQL statements executed.", ("engine",)
+))
+db_query_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "SQL statement execution time.", ("engine",)
+))
+db_pool_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", ("engine",)
+))
+transfer_outcomes = registry.register(Counter(
+    "transfer_outcomes_total", "Transfer results by outcome.", ("outcome",)
+))
+transaction_retries = registry.register(Counter(
+    "transaction_retries_total", "Balance transactions retried after a lock or serialization conflict.", ("operation", "reason")
+))
+transaction_conflicts = registry.register(Counter(
+    "transaction_conflicts_total", "Balance transactions that still conflicted after every retry.", ("operation", "reason")
+))
+requests_rejected = registry.register(Counter(
+    "requests_rejected_total", "Requests turned away by admission control or rate limits.", ("reason",)
+))
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request counts and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            http_latency.observe(time.perf_counter() - start, scope["method"], path)
+            http_requests.inc(scope["method"], path, status_code)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    engine_label = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - start, self.engine_label)
+
+def timed_pool_class(label: str):
+    return type(f"TimedQueuePool_{label}", (TimedQueuePool,), {"engine_label": label})
+
+def instrument_engine(engine, label: str):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("query_start", None)
+        if start is not None:
+            db_query_latency.observe(time.perf_counter() - start, label)
+        db_queries.inc(label)
+
+def register_pool_gauges(engines: dict):
+    def in_use():
+        for label, engine in engines.items():
+            pool = engine.sync_engine.pool
+            if hasattr(pool, "checkedout"):
+                yield (label,), pool.checkedout()
+
+    def size():
+        for label, engine in engines.items():
+            pool = engine.sync_engine.pool
+            if hasattr(pool, "size"):
+                yield (label,), pool.size()
+
+    registry.register(Gauge("db_pool_connections_in_use", "Connections currently checked out.", in_use, ("engine",)))
+    registry.register(Gauge("db_pool_size", "Configured pool size.", size, ("engine",)))
+
+def register_cache_gauges(caches: dict):
+    def collect(field):
+        def callback():
+            for name, cache in caches.items():
+                yield (name,), cache.stats()[field]
+        return callback
+
+    for field in ("hits", "misses"):
+        registry.register(Gauge(
+            f"cache_{field}_total", f"Cache {field} since start.", collect(field), ("cache",), metric_type="counter"
+        ))
@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+from sqlalchemy import inspect, text
+from db.database import engine, SessionLocal
+from app.crud import backfill_opening_entries
+from app.models import Base
+from app.utils import logger
+
+def _add_column_sql(table, column, dialect):
+    sql = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        sql += f" DEFAULT {column.server_default.arg}"
+        if not column.nullable:
+            sql += " NOT NULL"
+    return sql
+
+def upgrade_schema(connection):
+    """Brings an existing database up to the models: creates missing tables,
+    then adds the columns and indexes that tables created earlier lack.
+
+    Returns the tables, columns and indexes it created.
+    """
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    changes = [f"table {table.name}" for table in Base.metadata.sorted_tables if table.name not in existing]
+    Base.metadata.create_all(connection)
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                connection.execute(text(_add_column_sql(table, column, connection.dialect)))
+                changes.append(f"column {table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                changes.append(f"index {index.name}")
+    return changes
+
+async def run_migrations(migrate_engine=engine):
+    async with migrate_engine.begin() as conn:
+        changes = await conn.run_sync(upgrade_schema)
+    for change in changes:
+        logger.info("[Migrate] Created %s", change)
+    logger.info("[Migrate] Schema up to date, %s changes", len(changes))
+    return changes
+
+async def run_backfills(session_factory=SessionLocal):
+    async with session_factory() as session:
+        backfilled = await backfill_opening_entries(session)
+    logger.info("[Migrate] Backfilled opening ledger entries for %s accounts", backfilled)
+    return backfilled
+
+async def migrate():
+    await run_migrations()
+    await run_backfills()
+
+def main():
+    argparse.ArgumentParser(
+        description="Create missing tables, columns and indexes, then backfill opening ledger entries for existing accounts."
+    ).parse_args()
+    asyncio.run(migrate())
+
+if __name__ == "__main__":
+    main()
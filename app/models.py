@@ -1,29 +1,100 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
-from sqlalchemy.orm import relationship, selectinload
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime
+from config.config import Config
 
 class Base(DeclarativeBase, AsyncAttrs):
     pass
 
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Customer(Base):
     __tablename__ = 'customers'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    accounts = relationship("BankAccount", back_populates="customer", lazy="selectin")
+    accounts = relationship("BankAccount", back_populates="customer", lazy="raise")
 
 class BankAccount(Base):
     __tablename__ = 'bank_accounts'
     id = Column(Integer, primary_key=True, index=True)
     balance = Column(Float, default=0)
     customer_id = Column(Integer, ForeignKey('customers.id'))
-    customer = relationship("Customer", back_populates="accounts", lazy="selectin")
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    customer = relationship("Customer", back_populates="accounts", lazy="raise")
 
 class TransferHistory(Base):
     __tablename__ = 'transfer_history'
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     from_account_id = Column(Integer, ForeignKey('bank_accounts.id'))
     to_account_id = Column(Integer, ForeignKey('bank_accounts.id'))
     amount = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # A partitioned table's primary key has to include the partition key.
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=Config.TRANSFER_HISTORY_PARTITIONED)
+
+    __table_args__ = (
+        Index("ix_transfer_history_from_account_id_timestamp", "from_account_id", "timestamp"),
+        Index("ix_transfer_history_to_account_id_timestamp", "to_account_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"} if Config.TRANSFER_HISTORY_PARTITIONED else {},
+    )
+
+class LedgerEntry(Base):
+    __tablename__ = 'ledger_entries'
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey('bank_accounts.id'), nullable=False)
+    entry_type = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    # Archived transfer partitions are dropped, and a partitioned table cannot
+    # be referenced by id alone, so the foreign key only exists unpartitioned.
+    transfer_id = Column(Integer, *([] if Config.TRANSFER_HISTORY_PARTITIONED else [ForeignKey('transfer_history.id')]), nullable=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_ledger_entries_account_id_timestamp", "account_id", "timestamp"),
+        # Running balances replay an account's entries by id from its nearest checkpoint.
+        Index("ix_ledger_entries_account_id_id", "account_id", "id"),
+    )
+
+class BalanceCheckpoint(Base):
+    __tablename__ = 'balance_checkpoints'
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey('bank_accounts.id'), nullable=False)
+    ledger_entry_id = Column(Integer, ForeignKey('ledger_entries.id'), nullable=False)
+    balance = Column(Float, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_balance_checkpoints_account_id_timestamp", "account_id", "timestamp"),
+        Index("ix_balance_checkpoints_account_id_ledger_entry_id", "account_id", "ledger_entry_id"),
+    )
+
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey('bank_accounts.id'), nullable=False)
+    event_type = Column(String, nullable=False, default="balance_changed")
+    balance = Column(Float, nullable=False)
+    version = Column(Integer, nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_outbox_events_account_id_id", "account_id", "id"),
+        Index("ix_outbox_events_timestamp", "timestamp"),
+    )
+
+class DailyAccountSummary(Base):
+    __tablename__ = 'daily_account_summaries'
+    account_id = Column(Integer, ForeignKey('bank_accounts.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    inflow = Column(Float, nullable=False, default=0)
+    outflow = Column(Float, nullable=False, default=0)
+    transfers_in = Column(Integer, nullable=False, default=0)
+    transfers_out = Column(Integer, nullable=False, default=0)
+    deposits = Column(Integer, nullable=False, default=0)
+    withdrawals = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import heapq
+import os
+import re
+from datetime import datetime
+from sqlalchemy import text, select, table, column
+from db.database import SessionLocal
+from app.models import TransferHistory
+from app.utils import logger
+from config.config import Config
+
+PARTITION_NAME = re.compile(r"^transfer_history_p(\d{4})(\d{2})$")
+ARCHIVE_NAME = re.compile(r"^transfer_history_(\d{4})-(\d{2})\.csv\.gz$")
+ARCHIVE_FIELDS = ("id", "from_account_id", "to_account_id", "amount", "timestamp")
+DEFAULT_PARTITION = "transfer_history_default"
+
+def month_start(value: datetime):
+    return datetime(value.year, value.month, 1)
+
+def add_months(month: datetime, months: int):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: datetime):
+    return f"transfer_history_p{month:%Y%m}"
+
+def archive_path(archive_dir: str, month: datetime):
+    return os.path.join(archive_dir, f"transfer_history_{month:%Y-%m}.csv.gz")
+
+async def list_partitions(session):
+    result = await session.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'transfer_history'::regclass"
+    ))
+    months = []
+    for name in result.scalars():
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+async def ensure_default_partition(session):
+    """Creates the DEFAULT partition, which takes rows no monthly partition covers yet.
+
+    Without it every transfer fails once the current month has no partition,
+    for instance when the maintenance job has not run in time.
+    """
+    await session.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF transfer_history DEFAULT"))
+    await session.commit()
+
+async def ensure_partitions(session, months_ahead: int = Config.TRANSFER_HISTORY_PARTITIONS_AHEAD, now: datetime = None):
+    """Creates monthly partitions from the current month through months_ahead."""
+    await ensure_default_partition(session)
+    current = month_start(now or datetime.utcnow())
+    existing = set(await list_partitions(session))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        moved = await _create_partition(session, month)
+        await session.commit()
+        if moved:
+            logger.info("[Partitions] Moved %s rows from %s into %s", moved, DEFAULT_PARTITION, partition_name(month))
+        created.append(partition_name(month))
+    return created
+
+async def _create_partition(session, month: datetime):
+    # A partition cannot be attached while the DEFAULT partition holds rows in
+    # its range, so those rows are moved over first. The lock keeps new rows
+    # from landing in the DEFAULT partition until the attach commits.
+    name = partition_name(month)
+    start, end = f"{month:%Y-%m-%d}", f"{add_months(month, 1):%Y-%m-%d}"
+    await session.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+    await session.execute(text(f"CREATE TABLE {name} (LIKE transfer_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    result = await session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE \"timestamp\" >= '{start}' AND \"timestamp\" < '{end}' RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await session.execute(text(f"ALTER TABLE transfer_history ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    return result.rowcount
+
+async def archive_partitions(session, archive_dir: str = Config.TRANSFER_HISTORY_ARCHIVE_DIR, retain_months: int = Config.TRANSFER_HISTORY_RETAIN_MONTHS, now: datetime = None):
+    """Moves partitions older than retain_months, and the expired rows left in
+    the DEFAULT partition, into gzip CSV files.
+
+    Old months no longer receive inserts, so each one is copied out while
+    still attached; only the detach and drop take the parent's lock.
+    """
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retain_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    for month in await list_partitions(session):
+        if month >= cutoff:
+            break
+        name = partition_name(month)
+        path = archive_path(archive_dir, month)
+        rows = await _write_archive(session, name, path)
+        await session.commit()
+        await session.execute(text(f"ALTER TABLE transfer_history DETACH PARTITION {name}"))
+        await session.execute(text(f"DROP TABLE {name}"))
+        await session.commit()
+        logger.info("[Partitions] Archived %s (%s rows) to %s", name, rows, path)
+        archived.append(path)
+    archived.extend(await _archive_default_partition(session, archive_dir, cutoff))
+    return archived
+
+async def _archive_default_partition(session, archive_dir: str, cutoff: datetime):
+    # Months that never got a partition of their own keep their rows in the
+    # DEFAULT partition; once expired they are archived month by month too.
+    # The lock holds off inserts between the copy and the delete, and the
+    # archive is written before the delete commits, so a failed run leaves
+    # duplicates for the next merge to drop rather than losing rows.
+    result = await session.execute(
+        text(f"SELECT DISTINCT date_trunc('month', \"timestamp\") FROM {DEFAULT_PARTITION} WHERE \"timestamp\" < :cutoff ORDER BY 1"),
+        {"cutoff": cutoff},
+    )
+    months = list(result.scalars())
+    await session.commit()
+    archived = []
+    for month in months:
+        start, end = month, add_months(month, 1)
+        path = archive_path(archive_dir, month)
+        await session.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE"))
+        rows = await _write_archive(session, DEFAULT_PARTITION, path, start, end)
+        await session.execute(
+            text(f"DELETE FROM {DEFAULT_PARTITION} WHERE \"timestamp\" >= :start AND \"timestamp\" < :end"),
+            {"start": start, "end": end},
+        )
+        await session.commit()
+        logger.info("[Partitions] Archived %s rows of %s from %s to %s", rows, f"{month:%Y-%m}", DEFAULT_PARTITION, path)
+        archived.append(path)
+    return archived
+
+async def _write_archive(session, table_name: str, path: str, start: datetime = None, end: datetime = None, batch_size: int = Config.STATEMENT_EXPORT_BATCH_SIZE):
+    partition = table(table_name, *(column(field, TransferHistory.__table__.c[field].type) for field in ARCHIVE_FIELDS))
+    query = select(partition).order_by(partition.c.timestamp, partition.c.id)
+    if start is not None:
+        query = query.where(partition.c.timestamp >= start, partition.c.timestamp < end)
+    result = await session.stream(query.execution_options(yield_per=batch_size))
+
+    rows = 0
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(ARCHIVE_FIELDS)
+        async for batch in result.partitions():
+            lines = [(row.id, row.from_account_id, row.to_account_id, row.amount, row.timestamp.isoformat()) for row in batch]
+            await asyncio.to_thread(writer.writerows, lines)
+            rows += len(lines)
+    if os.path.exists(path):
+        await asyncio.to_thread(_merge_archive, path, partial)
+    else:
+        os.replace(partial, path)
+    return rows
+
+def _merge_archive(path: str, partial: str):
+    """Merges a new archive into the existing one for the same month, keeping
+    (timestamp, id) order and dropping rows the existing file already holds."""
+    merged = path + ".merged"
+    key = lambda record: (datetime.fromisoformat(record[4]), int(record[0]))
+    with gzip.open(path, "rt", newline="") as existing, gzip.open(partial, "rt", newline="") as new, \
+            gzip.open(merged, "wt", newline="") as output:
+        existing_rows, new_rows = csv.reader(existing), csv.reader(new)
+        next(existing_rows)
+        next(new_rows)
+        writer = csv.writer(output)
+        writer.writerow(ARCHIVE_FIELDS)
+        previous = None
+        for record in heapq.merge(existing_rows, new_rows, key=key):
+            if key(record) != previous:
+                writer.writerow(record)
+                previous = key(record)
+    os.remove(partial)
+    os.replace(merged, path)
+
+def archived_months(archive_dir: str = Config.TRANSFER_HISTORY_ARCHIVE_DIR):
+    if not os.path.isdir(archive_dir):
+        return []
+    months = []
+    for name in os.listdir(archive_dir):
+        match = ARCHIVE_NAME.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+def archive_horizon(archive_dir: str = Config.TRANSFER_HISTORY_ARCHIVE_DIR):
+    """First timestamp not covered by an archive file, or None without archives."""
+    months = archived_months(archive_dir)
+    return add_months(months[-1], 1) if months else None
+
+def _read_archive(path: str, start_date, end_date, matches):
+    with gzip.open(path, "rt", newline="") as archive:
+        for record in csv.DictReader(archive):
+            row = {
+                "id": int(record["id"]),
+                "from_account_id": int(record["from_account_id"]),
+                "to_account_id": int(record["to_account_id"]),
+                "amount": float(record["amount"]),
+                "timestamp": datetime.fromisoformat(record["timestamp"]),
+            }
+            if start_date is not None and row["timestamp"] < start_date:
+                continue
+            if end_date is not None and row["timestamp"] >= end_date:
+                continue
+            if matches(row):
+                yield row
+
+async def iter_archived_transfers(start_date=None, end_date=None, matches=lambda row: True, archive_dir: str = Config.TRANSFER_HISTORY_ARCHIVE_DIR, batch_size: int = 1000):
+    """Yields archived transfers in (timestamp, id) order, opening only the months in range."""
+    for month in await asyncio.to_thread(archived_months, archive_dir):
+        if end_date is not None and month >= end_date:
+            break
+        if start_date is not None and add_months(month, 1) <= start_date:
+            continue
+        reader = _read_archive(archive_path(archive_dir, month), start_date, end_date, matches)
+        while True:
+            batch = await asyncio.to_thread(lambda: [row for _, row in zip(range(batch_size), reader)])
+            if not batch:
+                break
+            for row in batch:
+                yield row
+
+async def run_maintenance(interval: int = None):
+    while True:
+        async with SessionLocal() as session:
+            created = await ensure_partitions(session)
+            archived = await archive_partitions(session)
+        logger.info("[Partitions] Created %s partitions, archived %s", len(created), len(archived))
+        if interval is None:
+            return
+        await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming transfer_history partitions and archive expired ones.")
+    parser.add_argument("--loop", action="store_true", help="keep running every TRANSFER_HISTORY_MAINTENANCE_INTERVAL_SECONDS")
+    args = parser.parse_args()
+    if not Config.TRANSFER_HISTORY_PARTITIONED:
+        parser.error("TRANSFER_HISTORY_PARTITIONED is not enabled")
+    asyncio.run(run_maintenance(Config.TRANSFER_HISTORY_MAINTENANCE_INTERVAL_SECONDS if args.loop else None))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from app.utils import logger, request_id_var
+from config.config import Config
+
+PROFILE_HEADER = "x-profile"
+_bind_marker = re.compile(r"\$\d+|\?|%\(\w+\)s|:\w+")
+_value_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def statement_shape(statement: str):
+    """Normalizes SQL so executions that differ only in bind values or IN-list length compare equal."""
+    shape = _bind_marker.sub("?", statement)
+    shape = _value_list.sub("(?, ...)", shape)
+    return " ".join(shape.split())
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryProfile:
+    """Statements executed while a request (or a capture_queries block) is running."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.db_seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = Config.PROFILING_REPEAT_THRESHOLD):
+        """Statement shapes run at least `threshold` times, the usual sign of an N+1 loop."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def check_budget(self, max_statements: int, repeat_threshold: int = None):
+        problems = []
+        if self.count > max_statements:
+            problems.append(f"{self.count} statements, budget is {max_statements}")
+        if repeat_threshold is not None:
+            problems.extend(f"{count}x {shape}" for shape, count in self.repeated(repeat_threshold))
+        if problems:
+            statements = "\n".join(f"  {count}x {shape}" for shape, count in self.shapes.most_common())
+            raise QueryBudgetExceeded("; ".join(problems) + "\n" + statements)
+
+    def server_timing(self, total_seconds: float):
+        db_ms = self.db_seconds * 1000
+        total_ms = total_seconds * 1000
+        return (
+            f'db;dur={db_ms:.2f};desc="{self.count} queries", '
+            f"app;dur={max(total_ms - db_ms, 0):.2f}, total;dur={total_ms:.2f}"
+        )
+
+profile_var: ContextVar = ContextVar("query_profile", default=None)
+
+@contextmanager
+def capture_queries():
+    """Collects the statements run in this context, e.g. to assert a query budget in a test."""
+    profile = QueryProfile()
+    token = profile_var.set(profile)
+    try:
+        yield profile
+    finally:
+        profile_var.reset(token)
+
+def instrument_profiling(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if profile_var.get() is not None:
+            conn.info["profile_query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("profile_query_start", None)
+        profile = profile_var.get()
+        if profile is not None and start is not None:
+            profile.record(statement, time.perf_counter() - start)
+
+def parse_query_budgets(budgets: str):
+    """Parses "GET /accounts/{account_id}/balance=1,POST /transfer/=1" into a dict."""
+    parsed = {}
+    for item in filter(None, (part.strip() for part in budgets.split(","))):
+        route, _, budget = item.rpartition("=")
+        parsed[route.strip()] = int(budget)
+    return parsed
+
+def sign_profiling_token(secret: str, ttl: int = 600, now: float = None):
+    expires = int((now or time.time()) + ttl)
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def verify_profiling_token(secret: str, token: str, now: float = None):
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < (now or time.time()):
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def _load_sampler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError as e:
+        raise RuntimeError("PROFILING_CAPTURE_DIR requires the pyinstrument package") from e
+    return Profiler
+
+def _write_sample(sampler, path: str):
+    with open(path, "w") as output:
+        output.write(sampler.output_html())
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware that profiles requests when PROFILING_ENABLED is set
+    or the request carries a valid signed X-Profile header.
+
+    Profiled responses get Server-Timing (database vs. application time) and
+    X-Query-Count headers. Repeated statement shapes and route query budgets
+    are reported in the logs, and slow requests can be sampled to files.
+    """
+
+    def __init__(
+        self,
+        app,
+        enabled: bool = Config.PROFILING_ENABLED,
+        secret: str = Config.PROFILING_SECRET,
+        budgets: str = Config.PROFILING_QUERY_BUDGETS,
+        repeat_threshold: int = Config.PROFILING_REPEAT_THRESHOLD,
+        capture_dir: str = Config.PROFILING_CAPTURE_DIR,
+        slow_seconds: float = Config.PROFILING_SLOW_SECONDS,
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.secret = secret
+        self.budgets = parse_query_budgets(budgets)
+        self.repeat_threshold = repeat_threshold
+        self.capture_dir = capture_dir
+        self.slow_seconds = slow_seconds
+        self._sampler_class = _load_sampler() if capture_dir else None
+
+    def _requested(self, scope):
+        if self.enabled:
+            return True
+        if not self.secret:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                return verify_profiling_token(self.secret, value.decode("latin-1"))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = None
+        if self._sampler_class is not None:
+            sampler = self._sampler_class(interval=Config.PROFILING_SAMPLE_INTERVAL, async_mode="enabled")
+            sampler.start()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing(time.perf_counter() - start))
+                headers.append("X-Query-Count", str(profile.count))
+            await send(message)
+
+        with capture_queries() as profile:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                elapsed = time.perf_counter() - start
+                if sampler is not None:
+                    sampler.stop()
+        route = scope.get("route")
+        name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+        self._report(name, profile, elapsed)
+        if sampler is not None and elapsed >= self.slow_seconds:
+            await self._save_sample(sampler, name)
+
+    def _report(self, name: str, profile: QueryProfile, elapsed: float):
+        logger.info(
+            "[Profiling] %s: %s statements, db %.2fms, total %.2fms",
+            name, profile.count, profile.db_seconds * 1000, elapsed * 1000,
+        )
+        for shape, count in profile.repeated(self.repeat_threshold):
+            logger.warning("[Profiling] %s ran the same statement %s times: %s", name, count, shape[:500])
+        budget = self.budgets.get(name)
+        if budget is not None and profile.count > budget:
+            logger.warning("[Profiling] %s ran %s statements, over its budget of %s", name, profile.count, budget)
+
+    async def _save_sample(self, sampler, name: str):
+        os.makedirs(self.capture_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        path = os.path.join(self.capture_dir, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{slug}-{request_id_var.get()}.html")
+        await asyncio.to_thread(_write_sample, sampler, path)
+        logger.info("[Profiling] Saved sampling profile of %s to %s", name, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a signed X-Profile header value for profiling individual requests.")
+    parser.add_argument("--ttl", type=int, default=600, help="seconds the header stays valid")
+    args = parser.parse_args()
+    if not Config.PROFILING_SECRET:
+        parser.error("PROFILING_SECRET is not set")
+    print(f"X-Profile: {sign_profiling_token(Config.PROFILING_SECRET, args.ttl)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import argparse
+import asyncio
+from datetime import date
+from db.database import SessionLocal
+from app.crud import rebuild_daily_summaries
+from app.utils import logger
+
+async def run_rebuild(start_day: date = None, end_day: date = None):
+    async with SessionLocal() as session:
+        rebuilt = await rebuild_daily_summaries(session, start_day, end_day)
+    logger.info("[Rollups] Rebuilt %s daily account summaries", rebuilt)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily account summaries from the ledger and transfer history.")
+    parser.add_argument("--from", dest="start_day", type=date.fromisoformat, help="first day to rebuild (default: all history)")
+    parser.add_argument("--to", dest="end_day", type=date.fromisoformat, help="last day to rebuild, inclusive (default: today)")
+    args = parser.parse_args()
+    asyncio.run(run_rebuild(args.start_day, args.end_day))
+
+if __name__ == "__main__":
+    main()
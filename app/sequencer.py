@@ -0,0 +1,95 @@
+import asyncio
+from app.crud import apply_operations
+from app.utils import logger
+from config.config import Config
+
+class AccountSequencer:
+    """Routes balance operations through per-shard queues and group-commits them.
+
+    Operations on the same account always land on the same shard, so a hot
+    account is drained by one worker that applies everything queued behind
+    it in a single transaction instead of one commit per operation.
+
+    A transfer goes to the shard of whichever side has more operations in
+    flight, so transfers into a hot account (fee collection, payroll)
+    coalesce on its shard just like transfers out of it.
+    """
+
+    def __init__(self, session_factory, shards: int = Config.SEQUENCER_SHARDS, max_batch: int = Config.SEQUENCER_MAX_BATCH):
+        self.session_factory = session_factory
+        self.shards = shards
+        self.max_batch = max_batch
+        self._queues = []
+        self._workers = []
+        self._pending = {}
+
+    @property
+    def running(self):
+        return bool(self._workers)
+
+    def start(self):
+        if self.running:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.shards)]
+        self._workers = [asyncio.create_task(self._drain(queue)) for queue in self._queues]
+
+    async def stop(self):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def deposit(self, account_id: int, amount: float):
+        return await self._submit(account_id, {"kind": "deposit", "account_id": account_id, "amount": amount})
+
+    async def withdraw(self, account_id: int, amount: float):
+        return await self._submit(account_id, {"kind": "withdraw", "account_id": account_id, "amount": amount})
+
+    async def transfer(self, from_account_id: int, to_account_id: int, amount: float):
+        hot_account_id = to_account_id if self.pending(to_account_id) > self.pending(from_account_id) else from_account_id
+        return await self._submit(hot_account_id, {
+            "kind": "transfer",
+            "from_account_id": from_account_id,
+            "to_account_id": to_account_id,
+            "amount": amount,
+        }, (from_account_id, to_account_id))
+
+    def pending(self, account_id: int):
+        """Operations touching the account that are queued or being applied."""
+        return self._pending.get(account_id, 0)
+
+    async def _submit(self, account_id: int, operation: dict, account_ids=None):
+        self.start()
+        account_ids = account_ids or (account_id,)
+        for touched in account_ids:
+            self._pending[touched] = self.pending(touched) + 1
+        try:
+            future = asyncio.get_running_loop().create_future()
+            await self._queues[account_id % self.shards].put((operation, future))
+            return await future
+        finally:
+            for touched in account_ids:
+                self._pending[touched] -= 1
+                if not self._pending[touched]:
+                    del self._pending[touched]
+
+    async def _drain(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                async with self.session_factory() as session:
+                    results = await apply_operations(session, [operation for operation, _ in batch])
+            except Exception as e:
+                logger.error("[Sequencer] Group commit of %s operations failed: %s", len(batch), e)
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,37 @@
+import argparse
+import asyncio
+import getpass
+import sys
+from fastapi import HTTPException
+from db.database import SessionLocal
+from app.auth import password_hasher
+from app.crud import create_user
+from app.utils import logger
+
+async def add_user(username: str, password: str):
+    hashed_password = await password_hasher.hash(password)
+    async with SessionLocal() as session:
+        try:
+            user = await create_user(session, username, hashed_password)
+        except HTTPException as e:
+            logger.error("[Users] Could not create user %s: %s", username, e.detail)
+            sys.exit(1)
+    logger.info("[Users] Created user %s (id=%s)", user.username, user.id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a user that can log in through /token.")
+    parser.add_argument("username")
+    parser.add_argument("--password-stdin", action="store_true", help="read the password from stdin instead of prompting")
+    args = parser.parse_args()
+    if args.password_stdin:
+        password = sys.stdin.readline().rstrip("\n")
+    else:
+        password = getpass.getpass("Password: ")
+        if password != getpass.getpass("Repeat password: "):
+            parser.error("passwords do not match")
+    if not password:
+        parser.error("password must not be empty")
+    asyncio.run(add_user(args.username, password))
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,102 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from config.config import Config
 
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+log_sampled_var: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the request ID and drops unsampled info-level records.
+
+    Runs in the calling task, where the request's context variables are set,
+    before the record is handed to the background listener.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return record.levelno >= logging.WARNING or log_sampled_var.get()
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_message_length: int = Config.LOG_MAX_MESSAGE_LENGTH):
+        super().__init__()
+        self.max_message_length = max_message_length
+
+    def format(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_message_length:
+            message = f"{message[:self.max_message_length]}...(truncated {len(message) - self.max_message_length} chars)"
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": message,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler.prepare() formats the message on the calling thread; leave
+    # that to the listener so the event loop only pays for the enqueue.
+    def prepare(self, record):
+        return record
+
+class RouteSampler:
+    """Per-route sample rates for info-level success logs.
+
+    Rates come from LOG_SAMPLE_RATES, e.g.
+    "GET /accounts/{account_id}/balance=0.01,GET /accounts/{account_id}=0.1".
+    """
+
+    def __init__(self, rates: str = Config.LOG_SAMPLE_RATES, default_rate: float = Config.LOG_INFO_SAMPLE_RATE):
+        self.default_rate = default_rate
+        self.rates = {}
+        for item in filter(None, (part.strip() for part in rates.split(","))):
+            route, _, rate = item.rpartition("=")
+            self.rates[route.strip()] = float(rate)
+
+    def sample(self, method: str, route_path: str):
+        rate = self.rates.get(f"{method} {route_path}", self.default_rate)
+        return rate >= 1 or random.random() < rate
+
+def new_request_id(incoming: str = None):
+    return incoming or uuid.uuid4().hex
+
 def setup_logging():
-    logging.basicConfig(
-        level=Config.LOGGING_LEVEL,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+    if Config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     logger = logging.getLogger("bank_app")
     logger.setLevel(Config.LOGGING_LEVEL)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
     return logger
 
-logger = setup_logging()
\ No newline at end of file
+logger = setup_logging()
+
+def encode_cursor(timestamp: datetime, record_id: int) -> str:
+    return f"{timestamp.isoformat()}_{record_id}"
+
+def decode_cursor(cursor: str):
+    timestamp, _, record_id = cursor.rpartition("_")
+    return datetime.fromisoformat(timestamp), int(record_id)
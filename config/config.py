@@ -2,6 +2,81 @@ import os
 
 class Config:
     DATABASE_URL = os.getenv("DATABASE_URL")
+    READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+    DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "5"))
+    DB_HEALTH_CHECK_TIMEOUT = float(os.getenv("DB_HEALTH_CHECK_TIMEOUT", "2"))
+    SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+    DB_ADMISSION_LIMIT = int(os.getenv("DB_ADMISSION_LIMIT", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+    DB_ADMISSION_MAX_WAITING = int(os.getenv("DB_ADMISSION_MAX_WAITING", "100"))
+    DB_ADMISSION_QUEUE_TIMEOUT = float(os.getenv("DB_ADMISSION_QUEUE_TIMEOUT", "0.5"))
+    DB_ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("DB_ADMISSION_RETRY_AFTER_SECONDS", "1"))
+    RATE_LIMIT_READ_PER_SECOND = float(os.getenv("RATE_LIMIT_READ_PER_SECOND", "0"))
+    RATE_LIMIT_READ_BURST = int(os.getenv("RATE_LIMIT_READ_BURST", "100"))
+    RATE_LIMIT_WRITE_PER_SECOND = float(os.getenv("RATE_LIMIT_WRITE_PER_SECOND", "0"))
+    RATE_LIMIT_WRITE_BURST = int(os.getenv("RATE_LIMIT_WRITE_BURST", "20"))
+    RATE_LIMIT_MAX_SUBJECTS = int(os.getenv("RATE_LIMIT_MAX_SUBJECTS", "100000"))
+    READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+    READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
     SECRET_KEY = os.getenv("SECRET_KEY")
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
-    LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO")
\ No newline at end of file
+    LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+    LOG_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "2048"))
+    LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+    PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "64"))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "1"))
+    PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", "16384"))
+    LOGIN_FAILURE_CACHE_SIZE = int(os.getenv("LOGIN_FAILURE_CACHE_SIZE", "100000"))
+    LOGIN_FAILURE_CACHE_SECONDS = float(os.getenv("LOGIN_FAILURE_CACHE_SECONDS", "60"))
+    BALANCE_CHECKPOINT_MIN_ENTRIES = int(os.getenv("BALANCE_CHECKPOINT_MIN_ENTRIES", "100"))
+    BALANCE_CHECKPOINT_SETTLE_SECONDS = int(os.getenv("BALANCE_CHECKPOINT_SETTLE_SECONDS", "60"))
+    BALANCE_CHECKPOINT_INTERVAL_SECONDS = int(os.getenv("BALANCE_CHECKPOINT_INTERVAL_SECONDS", "300"))
+    TRANSACTION_ISOLATION_LEVEL = os.getenv("TRANSACTION_ISOLATION_LEVEL", "")
+    TRANSACTION_LOCK_NOWAIT = os.getenv("TRANSACTION_LOCK_NOWAIT", "false").lower() == "true"
+    TRANSACTION_MAX_RETRIES = int(os.getenv("TRANSACTION_MAX_RETRIES", "5"))
+    TRANSACTION_RETRY_BASE_DELAY = float(os.getenv("TRANSACTION_RETRY_BASE_DELAY", "0.01"))
+    TRANSACTION_RETRY_MAX_DELAY = float(os.getenv("TRANSACTION_RETRY_MAX_DELAY", "0.5"))
+    SEQUENCER_ENABLED = os.getenv("SEQUENCER_ENABLED", "false").lower() == "true"
+    SEQUENCER_SHARDS = int(os.getenv("SEQUENCER_SHARDS", "16"))
+    SEQUENCER_MAX_BATCH = int(os.getenv("SEQUENCER_MAX_BATCH", "256"))
+    ACCOUNT_CACHE_BACKEND = os.getenv("ACCOUNT_CACHE_BACKEND", "memory")
+    ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "100000"))
+    ACCOUNT_CACHE_TTL_SECONDS = float(os.getenv("ACCOUNT_CACHE_TTL_SECONDS", "30"))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    STATEMENT_EXPORT_BATCH_SIZE = int(os.getenv("STATEMENT_EXPORT_BATCH_SIZE", "2000"))
+    STATEMENT_EXPORT_PARALLELISM = int(os.getenv("STATEMENT_EXPORT_PARALLELISM", "4"))
+    BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", "1000"))
+    BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50000"))
+    TRANSFER_HISTORY_PARTITIONED = os.getenv("TRANSFER_HISTORY_PARTITIONED", "false").lower() == "true"
+    TRANSFER_HISTORY_PARTITIONS_AHEAD = int(os.getenv("TRANSFER_HISTORY_PARTITIONS_AHEAD", "3"))
+    TRANSFER_HISTORY_RETAIN_MONTHS = int(os.getenv("TRANSFER_HISTORY_RETAIN_MONTHS", "24"))
+    TRANSFER_HISTORY_ARCHIVE_DIR = os.getenv("TRANSFER_HISTORY_ARCHIVE_DIR", "archive/transfer_history")
+    TRANSFER_HISTORY_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("TRANSFER_HISTORY_MAINTENANCE_INTERVAL_SECONDS", "86400"))
+    OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "0.25"))
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "1000"))
+    OUTBOX_GAP_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_GAP_TIMEOUT_SECONDS", "10"))
+    OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", "86400"))
+    OUTBOX_PRUNE_INTERVAL_SECONDS = float(os.getenv("OUTBOX_PRUNE_INTERVAL_SECONDS", "60"))
+    EVENT_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "100"))
+    EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+    PROFILING_REPEAT_THRESHOLD = int(os.getenv("PROFILING_REPEAT_THRESHOLD", "3"))
+    PROFILING_QUERY_BUDGETS = os.getenv("PROFILING_QUERY_BUDGETS", "")
+    PROFILING_CAPTURE_DIR = os.getenv("PROFILING_CAPTURE_DIR", "")
+    PROFILING_SLOW_SECONDS = float(os.getenv("PROFILING_SLOW_SECONDS", "0.5"))
+    PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", "0.001"))
+    ACCOUNT_LOOKUP_MAX_IDS = int(os.getenv("ACCOUNT_LOOKUP_MAX_IDS", "500"))
+    PORTFOLIO_RECENT_TRANSFERS = int(os.getenv("PORTFOLIO_RECENT_TRANSFERS", "5"))
+    PORTFOLIO_MAX_RECENT_TRANSFERS = int(os.getenv("PORTFOLIO_MAX_RECENT_TRANSFERS", "50"))
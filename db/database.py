@@ -1,21 +1,119 @@
+import time
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config.config import Config
+from app.utils import logger
+from app.metrics import timed_pool_class, instrument_engine
+from app.profiling import instrument_profiling
 
 DATABASE_URL = Config.DATABASE_URL if Config.DATABASE_URL is not None else "postgresql+asyncpg://user:password@db:5432/testdb"
+READ_DATABASE_URL = Config.READ_DATABASE_URL
 
-engine = create_async_engine(DATABASE_URL)
-SessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    expire_on_commit=False,
-    class_=AsyncSession
-)
+def engine_options(url: str, label: str = "primary"):
+    if url.startswith("sqlite"):
+        return {}
+    options = {
+        "poolclass": timed_pool_class(label),
+        "pool_size": Config.DB_POOL_SIZE,
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "pool_timeout": Config.DB_POOL_TIMEOUT,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+    }
+    if url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = {
+            "timeout": Config.DB_CONNECT_TIMEOUT,
+            "command_timeout": Config.DB_COMMAND_TIMEOUT,
+            "prepared_statement_cache_size": Config.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+def _sessionmaker(bind):
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=bind,
+        expire_on_commit=False,
+        class_=AsyncSession
+    )
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+SessionLocal = _sessionmaker(engine)
+instrument_engine(engine, "primary")
+instrument_profiling(engine)
+
+read_engine = create_async_engine(READ_DATABASE_URL, **engine_options(READ_DATABASE_URL, "replica")) if READ_DATABASE_URL else None
+ReadSessionLocal = _sessionmaker(read_engine) if read_engine is not None else None
+if read_engine is not None:
+    instrument_engine(read_engine, "replica")
+    instrument_profiling(read_engine)
+
+engines = {"primary": engine, "replica": read_engine} if read_engine is not None else {"primary": engine}
 
 Base = declarative_base()
 
+class ReplicaRouter:
+    """Decides per request whether a read may go to the replica.
+
+    Clients that wrote within READ_YOUR_WRITES_SECONDS read from the primary
+    so they see their own changes, and a replica that failed to hand out a
+    connection is skipped for READ_REPLICA_RETRY_SECONDS. Recent writes are
+    kept in this process only, keyed by read_client_key, so the guarantee does
+    not span workers or a client's token refresh.
+    """
+
+    def __init__(self, read_your_writes_seconds: float, retry_seconds: float, max_clients: int = 100000):
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.retry_seconds = retry_seconds
+        self.max_clients = max_clients
+        self.replica_down_until = 0.0
+        self._recent_writes = {}
+
+    def note_write(self, client: str):
+        now = time.monotonic()
+        if len(self._recent_writes) >= self.max_clients:
+            self._recent_writes = {key: until for key, until in self._recent_writes.items() if until > now}
+        self._recent_writes[client] = now + self.read_your_writes_seconds
+
+    def use_replica(self, client: str):
+        now = time.monotonic()
+        if now < self.replica_down_until:
+            return False
+        until = self._recent_writes.get(client)
+        if until is None:
+            return True
+        if until <= now:
+            del self._recent_writes[client]
+            return True
+        return False
+
+    def mark_replica_down(self):
+        self.replica_down_until = time.monotonic() + self.retry_seconds
+
+replica_router = ReplicaRouter(Config.READ_YOUR_WRITES_SECONDS, Config.READ_REPLICA_RETRY_SECONDS)
+
+def read_client_key(request: Request):
+    return request.headers.get("Authorization") or (request.client.host if request.client else "")
+
 async def get_db():
     async with SessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_read_db(request: Request):
+    # The replica probe checks out a connection right away, and route
+    # dependencies resolve in declaration order, so routes declare this after
+    # their user dependency: rejected and throttled requests never get here.
+    if ReadSessionLocal is not None and replica_router.use_replica(read_client_key(request)):
+        async with ReadSessionLocal() as session:
+            try:
+                await session.connection()
+            except Exception as e:
+                logger.warning("[Database] Read replica unavailable, falling back to primary: %s", e)
+                replica_router.mark_replica_down()
+            else:
+                yield session
+                return
+    async with SessionLocal() as session:
+        yield session
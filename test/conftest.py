@@ -2,7 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, patch
 from app.main import app
-from db.database import get_db
+from db.database import get_db, get_read_db
 
 @pytest.fixture(scope="module")
 def test_client():
@@ -11,5 +11,6 @@ def test_client():
         yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     with TestClient(app) as client:
         yield client
\ No newline at end of file
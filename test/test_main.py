@@ -1,14 +1,42 @@
+import asyncio
+import json
+import logging
+import signal
+import time
 from unittest.mock import AsyncMock, patch, MagicMock
 import pytest
+from datetime import datetime
+from collections import OrderedDict
+from types import SimpleNamespace
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from app.main import app
-from app.models import Customer, BankAccount, TransferHistory
+from jose import jwt
+from app.main import app, write_rate_limiter, read_rate_limiter
+from app.limits import ConcurrencyLimiter, RateLimiter
+from app.lifecycle import readiness, on_shutdown_signal
+from app.migrate import run_migrations
+from app.auth import TokenCache, TokenData, token_cache, PasswordHasher, authenticate_user, failed_login_cache
+from app.sequencer import AccountSequencer
+from app.cache import AccountCache, MemoryCacheBackend
+from app.metrics import Histogram, http_requests, transfer_outcomes, transaction_retries, transaction_conflicts
+from app.crud import TransactionConflict, _retry_conflicts, _account_exists, get_transfer_history, get_customer_portfolio, transfer_batch, apply_operations, transfer, deposit_funds, withdraw_funds, get_account_statements, get_balance_as_of, create_balance_checkpoints, get_account_summary, get_customer_summary, rebuild_daily_summaries, backfill_opening_entries
+from sqlalchemy.exc import DBAPIError
+from config.config import Config
+from app.events import EventDispatcher
+from app.partitions import add_months, archive_path, archive_horizon, iter_archived_transfers, ensure_partitions, archive_partitions, _write_archive
+from app.utils import JsonFormatter, RequestContextFilter, RouteSampler, log_sampled_var
+from db.database import ReplicaRouter, get_db, get_read_db
+from app.models import Base, Customer, BankAccount, TransferHistory, LedgerEntry, OutboxEvent, DailyAccountSummary
+from app.profiling import ProfilingMiddleware, QueryBudgetExceeded, capture_queries, instrument_profiling, sign_profiling_token
+from sqlalchemy import text, select, update, insert, table, column
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 client = TestClient(app)
 
 @pytest.fixture(scope="module")
 def token():
-    with patch("app.auth.create_access_token") as mock_create_access_token:
+    with patch("app.auth.create_access_token") as mock_create_access_token, \
+            patch("app.main.authenticate_user", new_callable=AsyncMock, return_value=SimpleNamespace(username="user")):
         mock_create_access_token.return_value = "testtoken"
         
         response = client.post("/token", data={"username": "user", "password": "password"})
@@ -132,3 +160,1134 @@ async def test_get_account_transfer_history(token):
         print("response: ", response.json())
         assert response.status_code == 200
         assert len(response.json()["transfer_history"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_create_transfer_batch(token):
+    mock_results = [{"index": 0, "status": "ok", "transfer_id": 1},
+                    {"index": 1, "status": "failed", "detail": "Insufficient funds"}]
+
+    with patch('app.main.transfer_batch', new_callable=AsyncMock, return_value=mock_results) as mock_batch:
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.post("/transfer/batch", json={"atomic": False,
+                                                         "transfers": [{"from_account_id": 1, "to_account_id": 2, "amount": 10.0},
+                                                                       {"from_account_id": 1, "to_account_id": 3, "amount": 900.0}]}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == {"succeeded": 1, "failed": 1, "results": mock_results}
+        assert mock_batch.await_args.kwargs == {"atomic": False}
+
+
+@pytest.mark.asyncio
+async def test_create_transfer_batch_atomic_rejected(token):
+    with patch('app.main.transfer_batch', new_callable=AsyncMock, side_effect=HTTPException(status_code=400, detail="Transfer 0: Insufficient funds")):
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.post("/transfer/batch", json={"transfers": [{"from_account_id": 1, "to_account_id": 2, "amount": 900.0}]}, headers=headers)
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Transfer 0: Insufficient funds"
+
+
+@pytest.mark.asyncio
+async def test_get_account_transfer_history_paginated(token):
+    mock_transfer_data = [TransferHistory(id=2, from_account_id=1, to_account_id=2, amount=50.0, timestamp=datetime(2024, 1, 2)),
+                          TransferHistory(id=1, from_account_id=2, to_account_id=1, amount=10.0, timestamp=datetime(2024, 1, 1))]
+    with patch('app.main.get_transfer_history', new_callable=AsyncMock, return_value=mock_transfer_data) as mock_history:
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/1/history?limit=2&before=2024-01-03T00:00:00_7", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["next_cursor"] == "2024-01-01T00:00:00_1"
+        assert response.json()["prev_cursor"] == "2024-01-02T00:00:00_2"
+        assert mock_history.await_args.kwargs["before"] == (datetime(2024, 1, 3), 7)
+        assert mock_history.await_args.kwargs["limit"] == 2
+
+
+@pytest.mark.asyncio
+async def test_get_account_statement_invalid_cursor(token):
+    with patch('app.main.get_account_statements', new_callable=AsyncMock, return_value=[]):
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/1/statement?after=not-a-cursor", headers=headers)
+
+        assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_account_balance_as_of(token):
+    with patch('app.main.get_balance_as_of', new_callable=AsyncMock, return_value=75.0) as mock_as_of:
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/1/balance?as_of=2024-01-31T23:59:59", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == {"balance": 75.0, "as_of": "2024-01-31T23:59:59"}
+        mock_as_of.assert_awaited_once()
+        assert mock_as_of.await_args.args[1:] == (1, datetime(2024, 1, 31, 23, 59, 59))
+
+
+@pytest.mark.asyncio
+async def test_get_account_statement_running_balance(token):
+    entry = LedgerEntry(id=3, account_id=1, entry_type="deposit", amount=25.0, timestamp=datetime(2024, 1, 2))
+    entry.running_balance = 125.0
+    with patch('app.main.get_account_statements', new_callable=AsyncMock, return_value=[entry]):
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/1/statement", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["statement"][0]["running_balance"] == 125.0
+        assert response.json()["statement"][0]["entry_type"] == "deposit"
+
+
+@pytest.mark.asyncio
+async def test_token_claims_cached(token):
+    token_cache.clear()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch('app.main.get_balance', new_callable=AsyncMock, return_value=100):
+        with patch('app.auth.jwt.decode', wraps=jwt.decode) as mock_decode:
+            client.get("/accounts/1/balance", headers=headers)
+            response = client.get("/accounts/1/balance", headers=headers)
+
+    assert response.status_code == 200
+    assert mock_decode.call_count == 1
+    assert token_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_token_cache_expires_and_evicts():
+    cache = TokenCache(maxsize=2)
+    cache.set("expired", TokenData(username="user"), time.time() - 1)
+    assert cache.get("expired") is None
+
+    cache.set("a", TokenData(username="a"), time.time() + 60)
+    cache.set("b", TokenData(username="b"), time.time() + 60)
+    cache.get("a")
+    cache.set("c", TokenData(username="c"), time.time() + 60)
+
+    assert cache.get("b") is None
+    assert cache.get("a").username == "a"
+    assert cache.get("c").username == "c"
+
+
+@pytest.mark.asyncio
+async def test_tampered_token_rejected(token):
+    token_cache.clear()
+    with patch('app.main.get_balance', new_callable=AsyncMock, return_value=100):
+        client.get("/accounts/1/balance", headers={"Authorization": f"Bearer {token}"})
+
+        response = client.get("/accounts/1/balance", headers={"Authorization": f"Bearer {token[:-2]}xx"})
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_deposit_routed_through_sequencer(token):
+    mock_account = BankAccount(id=1, customer_id=1, balance=150.0)
+
+    with patch('app.main.Config.SEQUENCER_ENABLED', True), \
+         patch('app.main.sequencer.deposit', new_callable=AsyncMock, return_value=mock_account) as mock_deposit, \
+         patch('app.main.deposit_funds', new_callable=AsyncMock) as mock_deposit_funds:
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.post("/accounts/1/deposit", json={"amount": 50.0}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == {"account_id": 1, "new_balance": 150.0}
+        mock_deposit.assert_awaited_once_with(1, 50.0)
+        mock_deposit_funds.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_sequencer_group_commits_per_shard():
+    batches = []
+
+    async def fake_apply_operations(session, operations):
+        batches.append([operation["kind"] for operation in operations])
+        return [HTTPException(status_code=400, detail="Insufficient funds") if operation["kind"] == "withdraw"
+                else BankAccount(id=operation["account_id"], balance=operation["amount"]) for operation in operations]
+
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock()
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    sequencer = AccountSequencer(session_factory, shards=1, max_batch=10)
+
+    with patch('app.sequencer.apply_operations', side_effect=fake_apply_operations):
+        results = await asyncio.gather(
+            sequencer.deposit(1, 10.0),
+            sequencer.deposit(1, 20.0),
+            sequencer.withdraw(1, 500.0),
+            return_exceptions=True,
+        )
+    await sequencer.stop()
+
+    assert [kind for batch in batches for kind in batch] == ["deposit", "deposit", "withdraw"]
+    assert len(batches) < 3
+    assert results[1].balance == 20.0
+    assert isinstance(results[2], HTTPException) and results[2].detail == "Insufficient funds"
+
+
+@pytest.mark.asyncio
+async def test_replica_router_reads_own_writes():
+    router = ReplicaRouter(read_your_writes_seconds=60, retry_seconds=60)
+    assert router.use_replica("Bearer a")
+
+    router.note_write("Bearer a")
+    assert not router.use_replica("Bearer a")
+    assert router.use_replica("Bearer b")
+
+    router.mark_replica_down()
+    assert not router.use_replica("Bearer b")
+
+
+@pytest.mark.asyncio
+async def test_get_read_db_falls_back_to_primary():
+    replica_session = MagicMock()
+    replica_session.connection = AsyncMock(side_effect=OSError("replica down"))
+    primary_session = MagicMock()
+    request = MagicMock()
+    request.headers = {"Authorization": "Bearer fallback"}
+
+    def session_factory(session):
+        factory = MagicMock()
+        factory.return_value.__aenter__ = AsyncMock(return_value=session)
+        factory.return_value.__aexit__ = AsyncMock(return_value=False)
+        return factory
+
+    router = ReplicaRouter(read_your_writes_seconds=60, retry_seconds=60)
+    with patch('db.database.ReadSessionLocal', session_factory(replica_session)), \
+         patch('db.database.SessionLocal', session_factory(primary_session)), \
+         patch('db.database.replica_router', router):
+        sessions = [session async for session in get_read_db(request)]
+
+    assert sessions == [primary_session]
+    assert not router.use_replica("Bearer other")
+
+
+@pytest.mark.asyncio
+async def test_account_cache_rejects_stale_versions():
+    cache = AccountCache(MemoryCacheBackend(maxsize=10, ttl=60))
+
+    await cache.store([{"id": 1, "customer_id": 1, "balance": 150.0, "version": 2}])
+    await cache.store([{"id": 1, "customer_id": 1, "balance": 100.0, "version": 1}])
+
+    assert await cache.get(1) == {"id": 1, "customer_id": 1, "balance": 150.0}
+    assert await cache.get(2) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "stale_writes": 1, "errors": 0}
+
+
+@pytest.mark.asyncio
+async def test_account_cache_expires_entries():
+    cache = AccountCache(MemoryCacheBackend(maxsize=10, ttl=0))
+
+    await cache.store([{"id": 1, "customer_id": 1, "balance": 150.0, "version": 2}])
+
+    assert await cache.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_get_account_information(token):
+    mock_account = {"id": 1, "customer_id": 1, "balance": 100.0}
+    with patch('app.main.get_account_details', new_callable=AsyncMock, return_value=mock_account):
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/1", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == mock_account
+
+
+@pytest.mark.asyncio
+async def test_request_id_echoed(token):
+    with patch('app.main.get_balance', new_callable=AsyncMock, return_value=100):
+        headers = {"Authorization": f"Bearer {token}", "X-Request-ID": "abc123"}
+
+        response = client.get("/accounts/1/balance", headers=headers)
+
+        assert response.headers["X-Request-ID"] == "abc123"
+
+
+@pytest.mark.asyncio
+async def test_json_log_format_truncates_and_tags_request():
+    record = logging.LogRecord("bank_app", logging.INFO, __file__, 1, "payload=%s", ("x" * 50,), None)
+    record.request_id = "req-1"
+
+    entry = json.loads(JsonFormatter(max_message_length=20).format(record))
+
+    assert entry["request_id"] == "req-1"
+    assert entry["message"] == "payload=" + "x" * 12 + "...(truncated 38 chars)"
+
+
+@pytest.mark.asyncio
+async def test_unsampled_requests_keep_warnings():
+    sampler = RouteSampler("GET /accounts/{account_id}/balance=0", default_rate=1.0)
+    log_filter = RequestContextFilter()
+    token_var = log_sampled_var.set(sampler.sample("GET", "/accounts/{account_id}/balance"))
+    try:
+        info = logging.LogRecord("bank_app", logging.INFO, __file__, 1, "ok", None, None)
+        warning = logging.LogRecord("bank_app", logging.WARNING, __file__, 1, "slow", None, None)
+        assert not log_filter.filter(info)
+        assert log_filter.filter(warning)
+    finally:
+        log_sampled_var.reset(token_var)
+    assert sampler.sample("POST", "/transfer/")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(token):
+    before = transfer_outcomes.value("insufficient_funds")
+    rejected = http_requests.value("POST", "/transfer/", 400)
+    failed = http_requests.value("POST", "/transfer/", 500)
+    with patch('app.main.transfer', new_callable=AsyncMock, side_effect=HTTPException(status_code=400, detail="Insufficient funds")):
+        headers = {"Authorization": f"Bearer {token}"}
+        transfer_response = client.post("/transfer/", json={"from_account_id": 1, "to_account_id": 2, "amount": 100.0}, headers=headers)
+
+    response = client.get("/metrics")
+
+    assert transfer_response.status_code == 400
+    assert response.status_code == 200
+    assert transfer_outcomes.value("insufficient_funds") == before + 1
+    assert http_requests.value("POST", "/transfer/", 400) == rejected + 1
+    assert http_requests.value("POST", "/transfer/", 500) == failed
+    assert 'http_requests_total{method="POST",route="/transfer/",status="400"}' in response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/transfer/"}' in response.text
+    assert "# TYPE db_pool_connections_in_use gauge" in response.text
+
+
+@pytest.mark.asyncio
+async def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+
+    lines = histogram.render()
+
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+
+@pytest.mark.asyncio
+async def test_customer_accounts_response_model(token):
+    rows = [{"id": 1, "customer_id": 7, "balance": 50.0, "version": 3}]
+
+    with patch('app.main.list_customer_accounts', new_callable=AsyncMock, return_value=rows):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/customers/7/accounts", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == [{"id": 1, "customer_id": 7, "balance": 50.0}]
+
+@pytest.mark.asyncio
+async def test_export_statements_streams_csv(token):
+    captured = {}
+
+    async def fake_export(session, export_format, **filters):
+        captured.update(filters, export_format=export_format)
+        yield "account_id,entry_id\n"
+        yield "1,10\n"
+
+    with patch('app.main.export_statements', new=fake_export):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/statements/export", params={"account_ids": [1, 2], "start_date": "2026-09-01T00:00:00"}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.text == "account_id,entry_id\n1,10\n"
+        assert captured["account_ids"] == [1, 2]
+        assert captured["export_format"] == "csv"
+        assert captured["start_date"] == datetime(2026, 9, 1)
+
+@pytest.mark.asyncio
+async def test_create_accounts_bulk_reports_per_row_results(token):
+    results = [
+        {"index": 0, "status": "ok", "account_id": 10},
+        {"index": 1, "status": "failed", "detail": "Customer does not exist"},
+    ]
+
+    with patch('app.main.create_bank_accounts_bulk', new_callable=AsyncMock, return_value=results) as mock_bulk:
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.post("/accounts/bulk", json={"accounts": [
+            {"customer_id": 1, "initial_deposit": 50},
+            {"customer_id": 999, "initial_deposit": 10},
+        ]}, headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {"created": 1, "failed": 1, "results": results}
+        assert mock_bulk.call_args[0][1][1] == {"customer_id": 999, "initial_deposit": 10.0}
+
+@pytest.mark.asyncio
+async def test_archived_transfers_read_only_months_in_range(tmp_path):
+    import gzip
+    for month, rows in ((datetime(2024, 1, 1), ["1,1,2,5.0,2024-01-05T00:00:00", "2,2,3,7.0,2024-01-20T00:00:00"]),
+                        (datetime(2024, 2, 1), ["3,3,1,9.0,2024-02-02T00:00:00"])):
+        with gzip.open(archive_path(str(tmp_path), month), "wt") as archive:
+            archive.write("id,from_account_id,to_account_id,amount,timestamp\n" + "\n".join(rows) + "\n")
+
+    assert add_months(datetime(2024, 12, 1), 1) == datetime(2025, 1, 1)
+    assert archive_horizon(str(tmp_path)) == datetime(2024, 3, 1)
+    rows = [row async for row in iter_archived_transfers(
+        datetime(2024, 1, 10), datetime(2024, 3, 1),
+        lambda row: 3 in (row["from_account_id"], row["to_account_id"]), archive_dir=str(tmp_path),
+    )]
+    assert [row["id"] for row in rows] == [2, 3]
+    assert rows[0]["timestamp"] == datetime(2024, 1, 20)
+
+@pytest.mark.asyncio
+async def test_event_dispatcher_publishes_in_order_and_tracks_gaps():
+    def event(event_id, account_id):
+        return SimpleNamespace(id=event_id, account_id=account_id, event_type="balance_changed", balance=10.0, version=event_id, timestamp=None)
+
+    session = MagicMock()
+    session.rollback = AsyncMock()
+    session.execute = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=[event(5, 1), event(7, 2)])))
+    dispatcher = EventDispatcher(MagicMock(), batch_size=10, queue_size=1)
+    dispatcher.last_id = 4
+
+    with patch.object(EventDispatcher, "start"):
+        first = dispatcher.subscribe(1)
+        second = dispatcher.subscribe(2)
+    assert await dispatcher.poll(session) == 2
+    assert dispatcher.last_id == 7
+    assert (await first.get())["id"] == 5
+    assert (await second.get())["id"] == 7
+
+    # The late id 6 is still delivered; a full queue closes its subscriber.
+    session.execute.return_value.all.return_value = [event(6, 1), event(8, 1)]
+    await dispatcher.poll(session)
+    assert dispatcher.last_id == 8
+    assert first.get_nowait() is None
+    assert dispatcher.subscriber_count() == 1
+
+@pytest.mark.asyncio
+async def test_account_summary_passes_day_range(token):
+    summary = {
+        "account_id": 1,
+        "totals": {"inflow": 10.0, "outflow": 4.0, "net": 6.0, "transfers_in": 1, "transfers_out": 1, "deposits": 0, "withdrawals": 0},
+        "days": [{"day": "2026-10-01", "inflow": 10.0, "outflow": 4.0, "transfers_in": 1, "transfers_out": 1, "deposits": 0, "withdrawals": 0}],
+    }
+
+    with patch('app.main.get_account_summary', new_callable=AsyncMock, return_value=summary) as mock_summary:
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/accounts/1/summary", params={"from": "2026-10-01", "to": "2026-10-31"}, headers=headers)
+        assert response.status_code == 200
+        assert response.json() == summary
+        assert mock_summary.call_args[0][1:] == (1, datetime(2026, 10, 1).date(), datetime(2026, 10, 31).date())
+
+        response = client.get("/accounts/1/summary", params={"from": "2026-10-31", "to": "2026-10-01"}, headers=headers)
+        assert response.status_code == 400
+
+def test_health_ready_follows_lifecycle():
+    assert client.get("/health/live").json() == {"status": "ok"}
+
+    with patch('app.main.check_database', new_callable=AsyncMock, return_value=True), \
+            patch.object(readiness, 'warmed', True), patch.object(readiness, 'draining', False):
+        response = client.get("/health/ready")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+        readiness.draining = True
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "draining"}
+
+@pytest.mark.asyncio
+async def test_write_rate_limit_returns_429_with_retry_after(token):
+    account = BankAccount(id=1, customer_id=1, balance=150.0)
+
+    with patch('app.main.deposit_funds', new_callable=AsyncMock, return_value=account) as mock_deposit, \
+            patch.object(write_rate_limiter, 'rate', 0.5), patch.object(write_rate_limiter, 'burst', 1), \
+            patch.object(write_rate_limiter, '_buckets', OrderedDict()):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.post("/accounts/1/deposit", json={"amount": 50.0}, headers=headers)
+        assert response.status_code == 200
+
+        response = client.post("/accounts/1/deposit", json={"amount": 50.0}, headers=headers)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "2"
+        assert mock_deposit.await_count == 1
+
+def test_rate_limiter_refills_per_subject():
+    limiter = RateLimiter("read", rate=2, burst=2)
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0.5
+    assert limiter.acquire("b", now=0) == 0
+    assert limiter.acquire("a", now=0.5) == 0
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_rejects_fast_when_full():
+    limiter = ConcurrencyLimiter(limit=1, max_waiting=1, queue_timeout=0.05, retry_after=3)
+
+    async with limiter.slot():
+        start = time.monotonic()
+        with pytest.raises(HTTPException) as waited:
+            async with limiter.slot():
+                pass
+        assert time.monotonic() - start < 1
+        assert waited.value.status_code == 503
+        assert waited.value.headers == {"Retry-After": "3"}
+
+        limiter.max_waiting = 0
+        with pytest.raises(HTTPException):
+            async with limiter.slot():
+                pass
+        assert limiter.in_flight == 1 and limiter.waiting == 0
+
+    async with limiter.slot():
+        assert limiter.in_flight == 1
+
+@pytest.mark.asyncio
+async def test_password_hasher_round_trip():
+    hasher = PasswordHasher(workers=2, n=2 ** 10)
+    hashed = await hasher.hash("s3cret")
+    assert hashed.startswith("scrypt$1024$8$1$")
+    assert await hasher.verify("s3cret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert not await hasher.verify("s3cret", None)
+    assert not PasswordHasher.verify_sync("s3cret", "fakehashedpassword")
+
+@pytest.mark.asyncio
+async def test_failed_logins_are_cached():
+    hasher = PasswordHasher(workers=1, n=2 ** 10)
+    user = SimpleNamespace(id=1, username="alice", hashed_password=hasher.hash_sync("right"))
+    session = AsyncMock()
+    failed_login_cache.clear()
+
+    with patch('app.auth.get_user_by_username', new_callable=AsyncMock, return_value=user), \
+            patch('app.auth.password_hasher', hasher), \
+            patch.object(hasher, "verify", wraps=hasher.verify) as mock_verify:
+        assert await authenticate_user(session, "alice", "right") is user
+        assert await authenticate_user(session, "alice", "wrong") is None
+        assert await authenticate_user(session, "alice", "wrong") is None
+        assert mock_verify.await_count == 2
+        assert failed_login_cache.stats()["hits"] == 1
+
+        response = client.post("/token", data={"username": "alice", "password": "wrong"})
+        assert response.status_code == 401
+    failed_login_cache.clear()
+
+@pytest.mark.asyncio
+async def test_cached_login_failure_ends_when_the_stored_hash_changes():
+    hasher = PasswordHasher(workers=1, n=2 ** 10)
+    session = AsyncMock()
+    failed_login_cache.clear()
+
+    with patch('app.auth.password_hasher', hasher):
+        # Unknown until python -m app.users creates the user.
+        with patch('app.auth.get_user_by_username', new_callable=AsyncMock, return_value=None):
+            assert await authenticate_user(session, "bob", "secret") is None
+        bob = SimpleNamespace(id=2, username="bob", hashed_password=hasher.hash_sync("secret"))
+        with patch('app.auth.get_user_by_username', new_callable=AsyncMock, return_value=bob):
+            assert await authenticate_user(session, "bob", "secret") is bob
+
+        # Rejected under the old hash, accepted once the password is reset.
+        bob.hashed_password = hasher.hash_sync("old")
+        with patch('app.auth.get_user_by_username', new_callable=AsyncMock, return_value=bob):
+            assert await authenticate_user(session, "bob", "new") is None
+            assert await authenticate_user(session, "bob", "new") is None
+            bob.hashed_password = hasher.hash_sync("new")
+            assert await authenticate_user(session, "bob", "new") is bob
+    failed_login_cache.clear()
+
+class _PostgresError(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+@pytest.mark.asyncio
+async def test_balance_transactions_retry_conflicts(token):
+    session = MagicMock()
+    session.in_transaction.return_value = False
+    attempts = []
+
+    @_retry_conflicts("test")
+    async def flaky(session, failures, sqlstate="40P01"):
+        attempts.append(sqlstate)
+        if len(attempts) <= failures:
+            raise DBAPIError("UPDATE bank_accounts", {}, _PostgresError(sqlstate))
+        return "done"
+
+    with patch('app.crud._retry_delay', return_value=0):
+        assert await flaky(session, 2) == "done"
+        assert transaction_retries.value("test", "deadlock") == 2
+
+        attempts.clear()
+        with patch.object(Config, 'TRANSACTION_MAX_RETRIES', 1), pytest.raises(TransactionConflict):
+            await flaky(session, 5, "40001")
+        assert len(attempts) == 2
+        assert transaction_conflicts.value("test", "serialization_failure") == 1
+
+        attempts.clear()
+        with pytest.raises(DBAPIError):
+            await flaky(session, 1, "23505")
+        assert len(attempts) == 1
+
+    with patch('app.main.transfer', new_callable=AsyncMock, side_effect=TransactionConflict("deadlock")):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.post("/transfer/", json={"from_account_id": 1, "to_account_id": 2, "amount": 10.0}, headers=headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+@pytest.mark.asyncio
+async def test_query_budget_flags_extra_and_repeated_statements():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    instrument_profiling(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        with capture_queries() as profile:
+            await get_transfer_history(session, 1)
+        profile.check_budget(1)
+
+        with capture_queries() as profile:
+            for account_id in (1, 2, 3):
+                await _account_exists(session, account_id)
+        assert profile.count == 3
+        assert len(profile.repeated(3)) == 1
+        with pytest.raises(QueryBudgetExceeded):
+            profile.check_budget(3, repeat_threshold=3)
+    await engine.dispose()
+
+def test_profiling_middleware_requires_signed_header():
+    from fastapi import FastAPI
+
+    profiled = FastAPI()
+
+    @profiled.get("/accounts/{account_id}")
+    async def read(account_id: int):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        instrument_profiling(engine)
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT :id"), {"id": account_id})
+            await conn.execute(text("SELECT :id"), {"id": account_id + 1})
+        await engine.dispose()
+        return {}
+
+    profiled_client = TestClient(ProfilingMiddleware(profiled, enabled=False, secret="s3cret"))
+    response = profiled_client.get("/accounts/1")
+    assert "Server-Timing" not in response.headers
+
+    response = profiled_client.get("/accounts/1", headers={"X-Profile": "1.forged"})
+    assert "Server-Timing" not in response.headers
+
+    response = profiled_client.get("/accounts/1", headers={"X-Profile": sign_profiling_token("s3cret")})
+    assert response.headers["X-Query-Count"] == "2"
+    assert response.headers["Server-Timing"].startswith('db;dur=')
+
+@pytest.mark.asyncio
+async def test_get_accounts_accepts_comma_separated_ids(token):
+    lookup = {"accounts": [{"id": 3, "customer_id": 1, "balance": 10.0}], "missing": [1, 2]}
+
+    with patch('app.main.get_accounts', new_callable=AsyncMock, return_value=lookup) as mock_lookup:
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/accounts?ids=3,1&ids=2", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == lookup
+        assert mock_lookup.call_args[0][1] == [3, 1, 2]
+
+        response = client.get("/accounts?ids=3,x", headers=headers)
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_customer_portfolio_query_budget():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    instrument_profiling(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add(Customer(id=1, name="Jane Doe"))
+        session.add_all([BankAccount(id=account_id, customer_id=1, balance=100.0) for account_id in (1, 2, 3)])
+        session.add_all([
+            TransferHistory(from_account_id=1 + i % 3, to_account_id=1 + (i + 1) % 3, amount=1.0 + i, timestamp=datetime(2026, 1, 1, 0, i))
+            for i in range(6)
+        ])
+        await session.commit()
+
+        with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))), capture_queries() as profile:
+            portfolio = await get_customer_portfolio(session, 1, 2)
+        profile.check_budget(2)
+
+    assert portfolio["total_balance"] == 300.0
+    assert [[transfer["id"] for transfer in account["recent_transfers"]] for account in portfolio["accounts"]] == [[6, 4], [5, 4], [6, 5]]
+    await engine.dispose()
+
+async def sqlite_accounts(balances: dict, url: str = "sqlite+aiosqlite:///:memory:"):
+    """SQLite database with one customer owning the given {account_id: balance} accounts."""
+    engine = create_async_engine(url)
+    instrument_profiling(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        session.add(Customer(id=1, name="Jane Doe"))
+        session.add_all([BankAccount(id=account_id, customer_id=1, balance=balance) for account_id, balance in balances.items()])
+        await session.commit()
+    return engine, session_factory
+
+async def account_rows(session):
+    balances = dict((await session.execute(select(BankAccount.id, BankAccount.balance))).all())
+    ledger = (await session.execute(
+        select(LedgerEntry.account_id, LedgerEntry.entry_type, LedgerEntry.amount, LedgerEntry.transfer_id).order_by(LedgerEntry.id)
+    )).all()
+    transfers = (await session.execute(
+        select(TransferHistory.id, TransferHistory.from_account_id, TransferHistory.to_account_id, TransferHistory.amount)
+    )).all()
+    return balances, [tuple(row) for row in ledger], [tuple(row) for row in transfers]
+
+@pytest.mark.asyncio
+async def test_transfer_batch_atomic_rolls_back_on_sqlite():
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+    batches = [
+        ([{"from_account_id": 1, "to_account_id": 2, "amount": 30.0}, {"from_account_id": 2, "to_account_id": 2, "amount": 5.0}],
+         400, "Transfer 1: Cannot transfer to the same account"),
+        ([{"from_account_id": 1, "to_account_id": 2, "amount": 30.0}, {"from_account_id": 1, "to_account_id": 2, "amount": 80.0}],
+         400, "Transfer 1: Insufficient funds"),
+        ([{"from_account_id": 1, "to_account_id": 3, "amount": 1.0}], 404, "Transfer 0: Account not found"),
+    ]
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+        async with session_factory() as session:
+            for transfers, status_code, detail in batches:
+                with pytest.raises(HTTPException) as rejected:
+                    await transfer_batch(session, transfers, atomic=True)
+                assert (rejected.value.status_code, rejected.value.detail) == (status_code, detail)
+            assert await account_rows(session) == ({1: 100.0, 2: 50.0}, [], [])
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_transfer_batch_per_item_commits_valid_transfers_on_sqlite():
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+    transfers = [
+        {"from_account_id": 1, "to_account_id": 2, "amount": 30.0},
+        {"from_account_id": 2, "to_account_id": 2, "amount": 5.0},
+        {"from_account_id": 1, "to_account_id": 3, "amount": 1.0},
+        {"from_account_id": 1, "to_account_id": 2, "amount": 80.0},
+        {"from_account_id": 2, "to_account_id": 1, "amount": 60.0},
+    ]
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+        async with session_factory() as session:
+            results = await transfer_batch(session, transfers, atomic=False)
+            assert results == [
+                {"index": 0, "status": "ok", "transfer_id": 1},
+                {"index": 1, "status": "failed", "detail": "Cannot transfer to the same account"},
+                {"index": 2, "status": "failed", "detail": "Account not found"},
+                {"index": 3, "status": "failed", "detail": "Insufficient funds"},
+                {"index": 4, "status": "ok", "transfer_id": 2},
+            ]
+            balances, ledger, history = await account_rows(session)
+            assert balances == {1: 130.0, 2: 20.0}
+            assert history == [(1, 1, 2, 30.0), (2, 2, 1, 60.0)]
+            assert ledger == [
+                (1, "transfer_out", -30.0, 1), (2, "transfer_in", 30.0, 1),
+                (2, "transfer_out", -60.0, 2), (1, "transfer_in", 60.0, 2),
+            ]
+            events = (await session.execute(select(OutboxEvent.account_id, OutboxEvent.balance).order_by(OutboxEvent.account_id))).all()
+            assert [tuple(event) for event in events] == [(1, 130.0), (2, 20.0)]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_sequencer_routes_transfers_to_the_hot_account_shard():
+    batches = []
+
+    async def fake_apply_operations(session, operations):
+        batches.append(operations)
+        return [BankAccount(id=4, balance=0.0) for _ in operations]
+
+    session_factory = MagicMock()
+    session_factory.return_value.__aenter__ = AsyncMock()
+    session_factory.return_value.__aexit__ = AsyncMock(return_value=False)
+    sequencer = AccountSequencer(session_factory, shards=4, max_batch=10)
+
+    with patch('app.sequencer.apply_operations', side_effect=fake_apply_operations):
+        await asyncio.gather(
+            sequencer.deposit(4, 10.0),
+            *(sequencer.transfer(from_account_id, 4, 1.0) for from_account_id in (1, 2, 3)),
+        )
+    await sequencer.stop()
+
+    # Routed by source account the three transfers would need three more shards.
+    assert len(batches) <= 2
+    assert sequencer.pending(4) == 0
+
+@pytest.mark.asyncio
+async def test_sequenced_operations_validate_transfers_like_transfer():
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+    operations = [
+        {"kind": "transfer", "from_account_id": 1, "to_account_id": 1, "amount": 10.0},
+        {"kind": "transfer", "from_account_id": 2, "to_account_id": 1, "amount": -10.0},
+        {"kind": "transfer", "from_account_id": 1, "to_account_id": 2, "amount": 10.0},
+    ]
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+        async with session_factory() as session:
+            results = await apply_operations(session, operations)
+            assert [(result.status_code, result.detail) for result in results[:2]] == [
+                (400, "Cannot transfer to the same account"),
+                (400, "Transfer amount must be positive"),
+            ]
+            assert results[2].id == 1
+            balances, ledger, history = await account_rows(session)
+            assert balances == {1: 90.0, 2: 60.0}
+            assert history == [(1, 1, 2, 10.0)]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_transfer_rejects_invalid_amounts_before_touching_balances():
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+        async with session_factory() as session:
+            for from_account_id, to_account_id, amount, detail in (
+                (1, 2, -25.0, "Transfer amount must be positive"),
+                (1, 2, 0.0, "Transfer amount must be positive"),
+                (1, 1, 25.0, "Cannot transfer to the same account"),
+            ):
+                with capture_queries() as profile, pytest.raises(HTTPException) as rejected:
+                    await transfer(session, from_account_id, to_account_id, amount)
+                assert (rejected.value.status_code, rejected.value.detail) == (400, detail)
+                assert profile.count == 0
+
+            record = await transfer(session, 1, 2, 25.0)
+            assert record.id == 1
+            balances, ledger, _ = await account_rows(session)
+            assert balances == {1: 75.0, 2: 75.0}
+            assert ledger == [(1, "transfer_out", -25.0, 1), (2, "transfer_in", 25.0, 1)]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_get_account_balance_as_of_unknown_account(token):
+    with patch('app.main.get_balance_as_of', new_callable=AsyncMock, side_effect=HTTPException(status_code=404, detail="Account not found")):
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get("/accounts/99/balance?as_of=2024-01-31T23:59:59", headers=headers)
+
+        assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_running_balances_and_as_of_replay_from_checkpoints():
+    engine, session_factory = await sqlite_accounts({1: 0.0, 2: 0.0})
+
+    def mark():
+        time.sleep(0.002)
+        marked = datetime.utcnow()
+        time.sleep(0.002)
+        return marked
+
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))), \
+         patch('app.crud.Config.BALANCE_CHECKPOINT_SETTLE_SECONDS', 0):
+        async with session_factory() as session:
+            before_any = mark()
+            await deposit_funds(session, 1, 100.0)
+            after_first_deposit = mark()
+            await deposit_funds(session, 1, 50.0)
+            await transfer(session, 1, 2, 30.0)
+            at_checkpoint = mark()
+            assert await create_balance_checkpoints(session, min_entries=1) == 2
+            await withdraw_funds(session, 1, 20.0)
+            await transfer(session, 2, 1, 10.0)
+            latest = mark()
+
+            pages = []
+            before = None
+            while True:
+                page = await get_account_statements(session, 1, limit=2, before=before)
+                if not page:
+                    break
+                pages.append([(entry.id, entry.running_balance) for entry in page])
+                before = (page[-1].timestamp, page[-1].id)
+            # The first page starts after the checkpoint at entry 3, the second spans it.
+            assert pages == [[(7, 110.0), (5, 100.0)], [(3, 120.0), (2, 150.0)], [(1, 100.0)]]
+
+            as_of = {moment: await get_balance_as_of(session, 1, moment) for moment in (before_any, after_first_deposit, at_checkpoint, latest)}
+            assert list(as_of.values()) == [0, 100.0, 120.0, 110.0]
+            assert await get_balance_as_of(session, 2, at_checkpoint) == 30.0
+            assert await get_balance_as_of(session, 2, latest) == 20.0
+
+            # Lookups past the checkpoint never read the entries behind it.
+            await session.execute(update(LedgerEntry).where(LedgerEntry.id == 1).values(amount=999.0))
+            assert await get_balance_as_of(session, 1, latest) == 110.0
+            assert await get_balance_as_of(session, 1, after_first_deposit) == 999.0
+            with pytest.raises(HTTPException) as missing:
+                await get_balance_as_of(session, 3, latest)
+            assert missing.value.status_code == 404
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_outbox_pruned_without_subscribers(tmp_path):
+    # A file database: the pruner is cancelled mid-query, and each new
+    # connection to :memory: would see an empty database.
+    engine, session_factory = await sqlite_accounts({1: 0.0}, f"sqlite+aiosqlite:///{tmp_path}/outbox.db")
+    async with session_factory() as session:
+        session.add_all([
+            OutboxEvent(account_id=1, balance=1.0, version=1, timestamp=datetime(2020, 1, 1)),
+            OutboxEvent(account_id=1, balance=2.0, version=2, timestamp=datetime.utcnow()),
+        ])
+        await session.commit()
+
+    dispatcher = EventDispatcher(session_factory)
+    dispatcher.start_pruning(interval=0.01)
+    await asyncio.sleep(0.1)
+    assert not dispatcher.running
+    await dispatcher.stop()
+
+    async with session_factory() as session:
+        assert (await session.execute(select(OutboxEvent.version))).scalars().all() == [2]
+    await engine.dispose()
+
+def test_read_sessions_opened_only_after_authentication_and_rate_limits(token):
+    opened = []
+
+    async def tracking_read_db():
+        opened.append(True)
+        yield MagicMock()
+
+    app.dependency_overrides[get_read_db] = tracking_read_db
+    try:
+        response = client.get("/accounts/1")
+        assert response.status_code == 401
+
+        with patch.object(read_rate_limiter, "rate", 1), patch.object(read_rate_limiter, "_buckets", OrderedDict({"user": (0, time.monotonic())})):
+            response = client.get("/accounts/1/statement", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 429
+    finally:
+        del app.dependency_overrides[get_read_db]
+    assert opened == []
+
+@pytest.mark.asyncio
+async def test_daily_summaries_match_the_ledger_and_rebuild():
+    engine, session_factory = await sqlite_accounts({1: 0.0, 2: 0.0})
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+        async with session_factory() as session:
+            await deposit_funds(session, 1, 100.0)
+            await deposit_funds(session, 2, 40.0)
+            await withdraw_funds(session, 1, 30.0)
+            await transfer(session, 1, 2, 20.0)
+            await transfer(session, 2, 1, 5.0)
+            await transfer_batch(session, [{"from_account_id": 1, "to_account_id": 2, "amount": 10.0}])
+
+            today = datetime.utcnow().date()
+            expected = {
+                1: {"inflow": 105.0, "outflow": 60.0, "transfers_in": 1, "transfers_out": 2, "deposits": 1, "withdrawals": 1},
+                2: {"inflow": 70.0, "outflow": 5.0, "transfers_in": 2, "transfers_out": 1, "deposits": 1, "withdrawals": 0},
+            }
+            ledger = (await session.execute(select(LedgerEntry.account_id, LedgerEntry.amount))).all()
+            for account_id, counts in expected.items():
+                amounts = [amount for entry_account_id, amount in ledger if entry_account_id == account_id]
+                assert counts["inflow"] == sum(amount for amount in amounts if amount > 0)
+                assert counts["outflow"] == -sum(amount for amount in amounts if amount < 0)
+
+            async def summaries():
+                return {account_id: await get_account_summary(session, account_id) for account_id in expected}
+
+            recorded = await summaries()
+            for account_id, counts in expected.items():
+                assert recorded[account_id]["days"] == [{"day": today, **counts}]
+                assert recorded[account_id]["totals"]["net"] == counts["inflow"] - counts["outflow"]
+            customer = await get_customer_summary(session, 1)
+            assert customer["totals"]["inflow"] == 175.0 and customer["totals"]["transfers_out"] == 3
+            await session.commit()
+
+            await session.execute(update(DailyAccountSummary).values(inflow=0, deposits=0))
+            await session.commit()
+            assert await rebuild_daily_summaries(session, today, today) == 2
+            assert await summaries() == recorded
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_ensure_partitions_keeps_a_default_partition():
+    session = MagicMock()
+    session.commit = AsyncMock()
+    session.execute = AsyncMock(return_value=MagicMock(rowcount=4))
+
+    with patch('app.partitions.list_partitions', new_callable=AsyncMock, return_value=[datetime(2026, 10, 1)]):
+        created = await ensure_partitions(session, months_ahead=1, now=datetime(2026, 10, 18))
+
+    assert created == ["transfer_history_p202611"]
+    statements = [str(call.args[0]) for call in session.execute.await_args_list]
+    assert statements[0].endswith("PARTITION OF transfer_history DEFAULT")
+    # Rows that reached the default partition move before the month is attached.
+    assert "DELETE FROM transfer_history_default" in statements[-2]
+    assert statements[-1].startswith("ALTER TABLE transfer_history ATTACH PARTITION transfer_history_p202611")
+
+@pytest.mark.asyncio
+async def test_archive_partitions_archives_expired_default_partition_rows(tmp_path):
+    import gzip
+    session = MagicMock()
+    session.commit = AsyncMock()
+    months = MagicMock()
+    months.scalars.return_value = [datetime(2026, 1, 1)]
+    session.execute = AsyncMock(return_value=months)
+
+    # January was archived before; the default partition still holds one row
+    # already in that archive (a retried run) and one that is not.
+    header = "id,from_account_id,to_account_id,amount,timestamp\n"
+    with gzip.open(archive_path(str(tmp_path), datetime(2026, 1, 1)), "wt") as archive:
+        archive.write(header + "1,1,2,5.0,2026-01-03T00:00:00\n3,1,2,7.0,2026-01-09T00:00:00\n")
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE transfer_history_default (id INTEGER, from_account_id INTEGER, to_account_id INTEGER, amount FLOAT, timestamp DATETIME)"
+        ))
+    default_partition = table("transfer_history_default", *(column(c.name, c.type) for c in TransferHistory.__table__.c))
+    stored = async_sessionmaker(engine)()
+    await stored.execute(insert(default_partition), [
+        {"id": 2, "from_account_id": 2, "to_account_id": 1, "amount": 6.0, "timestamp": datetime(2026, 1, 5)},
+        {"id": 3, "from_account_id": 1, "to_account_id": 2, "amount": 7.0, "timestamp": datetime(2026, 1, 9)},
+        {"id": 4, "from_account_id": 1, "to_account_id": 2, "amount": 8.0, "timestamp": datetime(2026, 5, 2)},
+    ])
+
+    async def write_default_rows(session, table_name, path, start, end):
+        return await _write_archive(stored, table_name, path, start, end)
+
+    with patch('app.partitions.list_partitions', new_callable=AsyncMock, return_value=[]), \
+            patch('app.partitions._write_archive', side_effect=write_default_rows):
+        archived = await archive_partitions(session, archive_dir=str(tmp_path), retain_months=6, now=datetime(2026, 10, 18))
+
+    assert archived == [archive_path(str(tmp_path), datetime(2026, 1, 1))]
+    statements = [str(call.args[0]) for call in session.execute.await_args_list]
+    assert "FROM transfer_history_default WHERE \"timestamp\" < :cutoff" in statements[0]
+    assert session.execute.await_args_list[0].args[1] == {"cutoff": datetime(2026, 4, 1)}
+    assert statements[1] == "LOCK TABLE transfer_history_default IN EXCLUSIVE MODE"
+    assert statements[2].startswith("DELETE FROM transfer_history_default")
+    rows = [row async for row in iter_archived_transfers(archive_dir=str(tmp_path))]
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert [path.name for path in tmp_path.iterdir()] == ["transfer_history_2026-01.csv.gz"]
+    await stored.close()
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_shutdown_signal_ends_event_streams():
+    dispatcher = EventDispatcher(MagicMock())
+    with patch.object(EventDispatcher, "start"):
+        first = dispatcher.subscribe(1)
+        second = dispatcher.subscribe(2)
+    first.put_nowait({"id": 1})
+
+    received = []
+    previous = signal.signal(signal.SIGUSR1, lambda signum, frame: received.append(signum))
+    try:
+        on_shutdown_signal(dispatcher.close_subscribers, (signal.SIGUSR1,))
+        signal.raise_signal(signal.SIGUSR1)
+        await asyncio.sleep(0)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
+    assert received == [signal.SIGUSR1]
+    assert first.get_nowait() is None and second.get_nowait() is None
+    assert dispatcher.subscriber_count() == 0
+
+@pytest.mark.asyncio
+async def test_migration_upgrades_a_database_from_before_the_ledger():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        for ddl in (
+            "CREATE TABLE customers (id INTEGER PRIMARY KEY, name VARCHAR)",
+            "CREATE TABLE bank_accounts (id INTEGER PRIMARY KEY, balance FLOAT, customer_id INTEGER REFERENCES customers (id))",
+            "CREATE TABLE transfer_history (id INTEGER PRIMARY KEY, from_account_id INTEGER, to_account_id INTEGER, amount FLOAT, timestamp DATETIME)",
+            "INSERT INTO customers (id, name) VALUES (1, 'Jane Doe')",
+            "INSERT INTO bank_accounts (id, balance, customer_id) VALUES (1, 100.0, 1)",
+        ):
+            await conn.execute(text(ddl))
+
+    changes = await run_migrations(engine)
+    assert "table ledger_entries" in changes and "table users" in changes
+    assert "column bank_accounts.version" in changes
+    assert "index ix_transfer_history_from_account_id_timestamp" in changes
+    assert await run_migrations(engine) == []
+
+    async with engine.connect() as conn:
+        assert (await conn.execute(select(BankAccount.balance, BankAccount.version))).one() == (100.0, 0)
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_backfill_opens_the_ledger_of_accounts_from_before_it():
+    # Balances stored without ledger entries, as accounts created before the ledger existed.
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+    with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))), \
+         patch('app.crud.Config.BALANCE_CHECKPOINT_SETTLE_SECONDS', 0):
+        async with session_factory() as session:
+            await deposit_funds(session, 1, 10.0)
+            time.sleep(0.002)
+            await create_balance_checkpoints(session, min_entries=1)
+            assert await get_balance_as_of(session, 1, datetime.utcnow()) == 10.0
+            await session.commit()
+
+            assert await backfill_opening_entries(session, chunk_size=1) == 2
+            assert await backfill_opening_entries(session) == 0
+
+            now = datetime.utcnow()
+            assert await get_balance_as_of(session, 1, now) == 110.0
+            assert await get_balance_as_of(session, 2, now) == 50.0
+            statement = await get_account_statements(session, 1)
+            assert [(entry.id, entry.entry_type, entry.running_balance) for entry in statement] == [
+                (1, "deposit", 110.0), (-1, "opening", 100.0),
+            ]
+            await session.commit()
+
+            await transfer(session, 1, 2, 30.0)
+            time.sleep(0.002)
+            assert await create_balance_checkpoints(session, min_entries=1) == 2
+            assert await get_balance_as_of(session, 1, datetime.utcnow()) == 80.0
+            assert [entry.running_balance for entry in await get_account_statements(session, 2)] == [80.0, 50.0]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_balance_routes_return_client_errors_over_http(token):
+    engine, session_factory = await sqlite_accounts({1: 100.0, 2: 50.0})
+
+    async def sqlite_db():
+        async with session_factory() as session:
+            yield session
+
+    headers = {"Authorization": f"Bearer {token}"}
+    app.dependency_overrides[get_db] = sqlite_db
+    try:
+        with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+            for body, status_code, detail in (
+                ({"from_account_id": 1, "to_account_id": 2, "amount": 500.0}, 400, "Insufficient funds"),
+                ({"from_account_id": 1, "to_account_id": 2, "amount": -5.0}, 400, "Transfer amount must be positive"),
+                ({"from_account_id": 1, "to_account_id": 1, "amount": 5.0}, 400, "Cannot transfer to the same account"),
+                ({"from_account_id": 1, "to_account_id": 9, "amount": 5.0}, 404, "Account not found"),
+            ):
+                response = client.post("/transfer/", json=body, headers=headers)
+                assert (response.status_code, response.json()["detail"]) == (status_code, detail)
+
+            for path, amount, status_code, detail in (
+                ("/accounts/9/deposit", 5.0, 404, "Account not found"),
+                ("/accounts/1/deposit", -5.0, 400, "Deposit amount must be positive"),
+                ("/accounts/9/withdraw", 5.0, 404, "Account not found"),
+                ("/accounts/1/withdraw", 5000.0, 400, "Insufficient funds"),
+            ):
+                response = client.post(path, json={"amount": amount}, headers=headers)
+                assert (response.status_code, response.json()["detail"]) == (status_code, detail)
+
+            response = client.post("/transfer/", json={"from_account_id": 1, "to_account_id": 2, "amount": 25.0}, headers=headers)
+            assert response.status_code == 200
+    finally:
+        del app.dependency_overrides[get_db]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_account_routes_return_404_for_unknown_account(token):
+    engine, session_factory = await sqlite_accounts({1: 100.0})
+
+    async def sqlite_db():
+        async with session_factory() as session:
+            yield session
+
+    headers = {"Authorization": f"Bearer {token}"}
+    app.dependency_overrides[get_read_db] = sqlite_db
+    try:
+        with patch('app.crud.account_cache', AccountCache(MemoryCacheBackend(100, 30))):
+            response = client.get("/accounts/9", headers=headers)
+            assert (response.status_code, response.json()["detail"]) == (404, "Account not found")
+
+            response = client.get("/accounts/1", headers=headers)
+            assert response.status_code == 200
+            assert response.json()["balance"] == 100.0
+    finally:
+        del app.dependency_overrides[get_read_db]
+    await engine.dispose()